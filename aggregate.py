@@ -0,0 +1,172 @@
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+from records import CURRENCIES
+
+PAYMENT_TYPES = ("Cash-in-showroom", "Card-in-showroom")
+CASH, CARD, OTHER = 0, 1, 2
+
+CURRENCY_INDEX = {currency: index for index, currency in enumerate(CURRENCIES)}
+PAYMENT_INDEX = {payment_type: index for index, payment_type in enumerate(PAYMENT_TYPES)}
+PLN = CURRENCY_INDEX["PLN"]
+
+# Валюта x тип платежа (наличные, карта, прочее) x тестовый ордер
+GROUP_SHAPE = (len(CURRENCIES), 3, 2)
+GROUP_SIZE = GROUP_SHAPE[0] * GROUP_SHAPE[1] * GROUP_SHAPE[2]
+
+
+# Перевод копеек/грошей в денежное значение — только при выводе
+def as_money(minor):
+    return minor / 100
+
+
+# Пачка ордеров в виде колонок: суммы в копейках и коды для группировки.
+# Неизвестная валюта кодируется как -1
+class OrderColumns:
+    __slots__ = ("sums", "currencies", "payments", "tests")
+
+    def __init__(self, orders):
+        size = len(orders)
+        self.sums = np.fromiter((order.amount for order in orders), np.int64, size)
+        self.currencies = np.fromiter((CURRENCY_INDEX.get(order.currency, -1) for order in orders), np.int8, size)
+        self.payments = np.fromiter((PAYMENT_INDEX.get(order.payment_type, OTHER) for order in orders), np.int8, size)
+        self.tests = np.fromiter((order.test_order for order in orders), np.bool_, size)
+
+    # Номер группы валюта x тип платежа x тест для строк с известной валютой
+    def group_keys(self):
+        known = self.currencies >= 0
+        keys = (
+            (self.currencies[known].astype(np.intp) * GROUP_SHAPE[1] + self.payments[known]) * GROUP_SHAPE[2]
+            + self.tests[known]
+        )
+        return known, keys
+
+    # Движение наличных PLN по каждой строке, остальные строки — ноль
+    def cash_pln(self):
+        return np.where((self.currencies == PLN) & (self.payments == CASH), self.sums, 0)
+
+
+# Итоги по группам в целых копейках и нарастающий остаток наличных PLN
+class Totals:
+    def __init__(self, pln_balance=0):
+        self.sums = np.zeros(GROUP_SHAPE, np.int64)
+        self.counts = np.zeros(GROUP_SHAPE, np.int64)
+        self.pln_balance = pln_balance
+
+    # Добавляет пачку и возвращает остаток наличных PLN после каждой её строки
+    def add(self, columns):
+        known, keys = columns.group_keys()
+        # bincount с весами считает во float64; суммы в копейках точны, пока меньше 2**53
+        sums = np.bincount(keys, weights=columns.sums[known], minlength=GROUP_SIZE)
+        self.sums += np.rint(sums).astype(np.int64).reshape(GROUP_SHAPE)
+        self.counts += np.bincount(keys, minlength=GROUP_SIZE).reshape(GROUP_SHAPE)
+
+        running = self.pln_balance + np.cumsum(columns.cash_pln())
+        if len(running):
+            self.pln_balance = int(running[-1])
+        return running
+
+    # Дописывает итоги следующего по времени отрезка; остаток PLN — на его конец
+    def extend(self, other):
+        self.sums += other.sums
+        self.counts += other.counts
+        self.pln_balance = other.pln_balance
+
+    # «Остатки по валютам»: наличные и карта вместе с тестовыми, количество — все документы валюты
+    def balance_summary(self):
+        return [
+            (currency, int(self.sums[index, CASH].sum()), int(self.sums[index, CARD].sum()), int(self.counts[index].sum()))
+            for currency, index in CURRENCY_INDEX.items()
+        ]
+
+    # «Баланс по валютам»: тестовые ордера только считаются, документы без типа платежа не входят
+    def ledger_summary(self):
+        return [
+            (
+                currency,
+                int(self.sums[index, CASH, 0]),
+                int(self.sums[index, CARD, 0]),
+                int(self.counts[index, CASH:OTHER, 0].sum()),
+                int(self.counts[index, CASH:OTHER, 1].sum())
+            )
+            for currency, index in CURRENCY_INDEX.items()
+        ]
+
+
+# Итоги нескольких независимых источников (аккаунтов) за один период:
+# суммы, количества и остатки наличных PLN складываются
+def combine_totals(parts):
+    combined = Totals()
+    for totals in parts:
+        combined.sums += totals.sums
+        combined.counts += totals.counts
+        combined.pln_balance += totals.pln_balance
+    return combined
+
+
+# Итоги по дням и префиксные суммы по ним: итоги любого периода из целых
+# дней — разность двух строк префикса, без обращения к самим ордерам
+class DailyRollup:
+    def __init__(self, orders):
+        orders = list(orders)
+        columns = OrderColumns(orders)
+        days, day_index = np.unique(np.array([order.moment[:10] for order in orders], dtype="U10"), return_inverse=True)
+        self.days = days.tolist()
+
+        known, keys = columns.group_keys()
+        keys = day_index[known].astype(np.intp) * GROUP_SIZE + keys
+        size = len(self.days) * GROUP_SIZE
+        # bincount с весами считает во float64; суммы за день точны, пока меньше 2**53 копеек
+        sums = np.rint(np.bincount(keys, weights=columns.sums[known], minlength=size)).astype(np.int64)
+        counts = np.bincount(keys, minlength=size)
+
+        # Строка i префикса — итоги за все дни до days[i], строка 0 нулевая
+        self.prefix_sums = np.zeros((len(self.days) + 1, *GROUP_SHAPE), np.int64)
+        self.prefix_counts = np.zeros((len(self.days) + 1, *GROUP_SHAPE), np.int64)
+        np.cumsum(sums.reshape(-1, *GROUP_SHAPE), axis=0, out=self.prefix_sums[1:])
+        np.cumsum(counts.reshape(-1, *GROUP_SHAPE), axis=0, out=self.prefix_counts[1:])
+
+    # Позиция дня в days; новый день вставляется вместе со строкой префикса
+    def _insert_day(self, day):
+        position = bisect_left(self.days, day)
+        if position == len(self.days) or self.days[position] != day:
+            self.days.insert(position, day)
+            self.prefix_sums = np.insert(self.prefix_sums, position + 1, self.prefix_sums[position], axis=0)
+            self.prefix_counts = np.insert(self.prefix_counts, position + 1, self.prefix_counts[position], axis=0)
+        return position
+
+    # Изменения отдельных ордеров (веб-хуки) без пересчёта по всем ордерам:
+    # строки префикса после дня ордера сдвигаются на его сумму и количество.
+    # Опустевшие дни остаются в days с нулевыми итогами
+    def apply(self, removed, added):
+        for orders, sign in ((removed, -1), (added, 1)):
+            columns = OrderColumns(orders)
+            known, keys = columns.group_keys()
+            keys = iter(keys.tolist())
+            for order, is_known, amount in zip(orders, known.tolist(), columns.sums.tolist()):
+                position = self._insert_day(order.moment[:10])
+                if is_known:
+                    key = next(keys)
+                    self.prefix_sums.reshape(len(self.days) + 1, GROUP_SIZE)[position + 1:, key] += sign * amount
+                    self.prefix_counts.reshape(len(self.days) + 1, GROUP_SIZE)[position + 1:, key] += sign
+
+    def _bounds(self, start_date, end_date):
+        return (
+            bisect_left(self.days, f"{start_date:%Y-%m-%d}"),
+            bisect_right(self.days, f"{end_date:%Y-%m-%d}")
+        )
+
+    # Остаток наличных PLN на начало дня start_date
+    def opening_pln_balance(self, start_date):
+        first, _ = self._bounds(start_date, start_date)
+        return int(self.prefix_sums[first, PLN, CASH].sum())
+
+    # Итоги за дни с start_date по end_date включительно; pln_balance — остаток на конец периода
+    def period_totals(self, start_date, end_date):
+        first, last = self._bounds(start_date, end_date)
+        last = max(first, last)
+        totals = Totals(int(self.prefix_sums[last, PLN, CASH].sum()))
+        totals.sums = self.prefix_sums[last] - self.prefix_sums[first]
+        totals.counts = self.prefix_counts[last] - self.prefix_counts[first]
+        return totals
@@ -0,0 +1,117 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+
+from metrics import RunMetrics, enable_logging
+from moysklad import BASE_URL, DEFAULT_CONCURRENCY, MoySkladClient
+from order_index import OrderIndex
+from order_store import OrderStore
+from report_core import FORMATS, LAYOUTS, render_orders, render_summary, sync_store
+
+
+# Периоды отчётов: (метка для имени файла, начало, конец включительно)
+def month_periods(year):
+    periods = []
+    for month in range(1, 13):
+        start = datetime(year, month, 1)
+        following = datetime(year + month // 12, month % 12 + 1, 1)
+        periods.append((f"{start:%Y-%m}", start, following - timedelta(microseconds=1)))
+    return periods
+
+
+# Дни шоурума — дни, в которые есть хотя бы один ордер
+def day_periods(index, year):
+    periods = []
+    for day in index.rollup.days:
+        if day.startswith(f"{year}-"):
+            start = datetime.strptime(day, "%Y-%m-%d")
+            periods.append((day, start, start + timedelta(days=1, microseconds=-1)))
+    return periods
+
+
+# Выполняется в процессе пула: получает только свой срез ордеров
+# (или готовые итоги для сводки), сам пишет файл на диск и возвращает
+# метрики формирования
+def render_file(path, layout, file_format, label, orders=None, opening_pln_balance=0, totals=None, memory=False):
+    metrics = RunMetrics("report", memory=memory, layout=layout, format=file_format, period=label, path=path)
+    with metrics.stage("render") as stage:
+        if totals is not None:
+            data = render_summary(layout, totals, file_format)
+        else:
+            data = render_orders(layout, orders, opening_pln_balance, file_format=file_format)
+            stage.rows = len(orders)
+        stage.bytes = len(data)
+    with metrics.stage("save") as stage:
+        with open(path, "wb") as output:
+            output.write(data)
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетная генерация отчётов без Streamlit")
+    parser.add_argument("--layout", choices=list(LAYOUTS), default="balance",
+                        help="balance — как в testy.py, ledger — как в app6.py")
+    parser.add_argument("--period", choices=["month", "day"], default="month",
+                        help="month — каждый месяц года, day — каждый день шоурума")
+    parser.add_argument("--year", type=int, default=date.today().year)
+    parser.add_argument("--summary-only", action="store_true", help="только сводный лист")
+    parser.add_argument("--format", choices=list(FORMATS), default="xlsx",
+                        help="csv и parquet — те же строки деталей (или сводка) с суммами в копейках")
+    parser.add_argument("--output", default="reports", help="каталог для файлов")
+    parser.add_argument("--store", default="orders.sqlite3", help="локальное хранилище ордеров")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--offline", action="store_true", help="не синхронизировать, взять данные из хранилища")
+    parser.add_argument("--metrics", help="дописывать метрики запуска и каждого файла строками JSON в этот файл")
+    parser.add_argument("--memory", action="store_true", help="добавлять к метрикам этапов RSS процесса")
+    args = parser.parse_args()
+    enable_logging()
+
+    # Данные загружаются один раз на весь запуск, отчёты строятся по общему индексу
+    started = time.perf_counter()
+    run = RunMetrics("batch", memory=args.memory, layout=args.layout, period=args.period, year=args.year,
+                     summary_only=args.summary_only)
+    store = OrderStore(args.store)
+    if not args.offline:
+        client = MoySkladClient(os.environ["MOYSKLAD_USERNAME"], os.environ["MOYSKLAD_PASSWORD"],
+                                base_url=args.base_url, concurrency=args.concurrency)
+        sync_store(store, client, run)
+        stats = client.stats()
+        print(f"синхронизация: запросов {stats['requests']}, повторов {stats['retries']}, "
+              f"отказов по лимиту {stats['throttled']}")
+    with run.stage("index") as stage:
+        index = OrderIndex.from_store(store)
+        stage.rows = len(index)
+    print(f"ордеров в индексе: {len(index)}, {time.perf_counter() - started:.1f}s")
+
+    periods = month_periods(args.year) if args.period == "month" else day_periods(index, args.year)
+    os.makedirs(args.output, exist_ok=True)
+    kind = "summary" if args.summary_only else "report"
+
+    with run.stage("reports") as stage, ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = []
+        for label, start, end in periods:
+            path = os.path.join(args.output, f"{args.layout}_{kind}_{label}.{FORMATS[args.format][0]}")
+            if args.summary_only:
+                future = pool.submit(render_file, path, args.layout, args.format, label,
+                                     totals=index.rollup.period_totals(start, end), memory=args.memory)
+            else:
+                future = pool.submit(render_file, path, args.layout, args.format, label, index.select(start, end),
+                                     index.rollup.opening_pln_balance(start), memory=args.memory)
+            futures.append(future)
+        stage.bytes = 0
+        for future in as_completed(futures):
+            metrics = future.result()
+            metrics.record(args.metrics)
+            stage.bytes += metrics.stages[0].bytes
+        stage.rows = len(periods)
+
+    run.record(args.metrics)
+    print(f"готово: {len(periods)} файлов за {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
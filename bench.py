@@ -0,0 +1,773 @@
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from io import BytesIO, TextIOWrapper
+
+import requests
+from openpyxl import Workbook, load_workbook
+from openpyxl.styles import Font
+
+from aggregate import DailyRollup, OrderColumns, Totals, as_money
+from consolidation import Account, AccountGroup
+from export import write_csv, write_parquet
+from metrics import RunMetrics
+from moysklad import CASH_ORDER_TYPES, PAGE_LIMIT, MoySkladClient
+from moysklad_stub import MoySkladStub
+from order_index import LiveIndex, OrderIndex
+from order_store import OrderStore
+from payload import slim_row
+from records import CURRENCIES, INCOME, CashOrder, parse_order
+from report import iter_chunks, write_balance_report
+from report_cache import ReportCache
+from report_core import LAYOUTS, render_report
+from report_fragments import render_month_report
+from synthetic import dataset_orders, synthetic_dataset, synthetic_orders, synthetic_rows, synthetic_webhooks
+from webhook_replay import WebhookReplay
+from webhooks import WebhookReceiver
+
+
+# Прежний разбор: цепочка проверок подстрок и отдельные проходы по attributes
+def legacy_slim(row, order_type):
+    currency_href = row["rate"]["currency"]["meta"]["href"]
+    currency = None
+    if "currency/e03f64a6-2225-11ed-0a80-073a00365127" in currency_href:
+        currency = 'PLN'
+    elif "currency/e15d9c47-2226-11ed-0a80-04b900364797" in currency_href:
+        currency = 'USD'
+    elif "currency/e1754d40-cc82-11ec-0a80-08ab00701a1e" in currency_href:
+        currency = 'EUR'
+    payment_type = next((attr['value']['name'] for attr in row.get('attributes', []) if attr['name'] == "PaymentType"), None)
+    test_order = next((attr['value'] for attr in row.get('attributes', []) if attr['name'] == "test_order"), False)
+    return {
+        "date": row["moment"].split(" ")[0],
+        "moment": row["moment"],
+        "name": row["name"],
+        "sum": row["sum"] if order_type == "cashin" else -row["sum"],
+        "currency": currency,
+        "payment_type": payment_type,
+        "test_order": test_order,
+        "doc_type": order_type,
+        "comment": row.get("description", ""),
+        "applicable": row["applicable"],
+    }
+
+
+def bench_ingest(size):
+    rows = list(synthetic_rows(size))
+    slotted = lambda row, order_type: parse_order(slim_row(row), order_type)
+    for label, parse in [("dict", legacy_slim), ("slotted", slotted)]:
+        tracemalloc.start()
+        started = time.perf_counter()
+        orders = [parse(row, "cashin") for row in rows]
+        elapsed = time.perf_counter() - started
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del orders
+        print(f"ingest {label:>8} rows={size:>8} {elapsed:8.3f}s {size / elapsed:10.0f} rows/s {memory / size:6.0f} B/row")
+
+
+# Прежний отбор по датам: strptime на каждую строку, исключение при отсутствии микросекунд
+def legacy_filter(orders, start_date, end_date):
+    filtered_orders = []
+    for order in orders:
+        try:
+            order_date = datetime.strptime(order.moment, '%Y-%m-%d %H:%M:%S.%f')
+        except ValueError:
+            order_date = datetime.strptime(order.moment, '%Y-%m-%d %H:%M:%S')
+        if start_date <= order_date <= end_date:
+            filtered_orders.append(order)
+    return filtered_orders
+
+
+def bench_select(size, queries):
+    rnd = random.Random(2)
+    # Каждая третья строка без миллисекунд, как в реальных данных
+    orders = [parse_order(slim_row(row), "cashin") for row in synthetic_rows(size)]
+    started = time.perf_counter()
+    index = OrderIndex(orders)
+    print(f"select index build rows={size:>8} {time.perf_counter() - started:8.3f}s")
+
+    first, last = datetime.fromisoformat(orders[0].moment), datetime.fromisoformat(orders[-1].moment)
+    periods = []
+    for _ in range(queries):
+        start = first + (last - first) * rnd.random()
+        periods.append((start, start + timedelta(days=rnd.randint(1, 90))))
+
+    for label, select in [("strptime", lambda s, e: legacy_filter(orders, s, e)), ("bisect", index.select)]:
+        started = time.perf_counter()
+        for start, end in periods:
+            select(start, end)
+        elapsed = time.perf_counter() - started
+        print(f"select {label:>10} rows={size:>8} {elapsed / queries * 1000:10.3f} ms/query")
+
+    for start, end in periods:
+        if index.select(start, end) != legacy_filter(orders, start, end):
+            raise SystemExit(f"выборки за {start} - {end} расходятся")
+
+
+def bench_summary(size, queries):
+    rnd = random.Random(3)
+    index = OrderIndex(synthetic_orders(size))
+    started = time.perf_counter()
+    rollup = index.rollup
+    print(f"summary rollup build rows={size:>8} days={len(rollup.days)} {time.perf_counter() - started:8.3f}s")
+
+    first, last = datetime.fromisoformat(rollup.days[0]), datetime.fromisoformat(rollup.days[-1])
+    periods = []
+    for _ in range(queries):
+        start = first + timedelta(days=rnd.randint(0, (last - first).days))
+        periods.append((start, datetime.combine(start + timedelta(days=rnd.randint(0, 365)), datetime.max.time())))
+
+    def scan(start, end):
+        totals = Totals(rollup.opening_pln_balance(start))
+        for chunk in iter_chunks(index.select(start, end)):
+            totals.add(OrderColumns(chunk))
+        return totals
+
+    for label, summarize in [("scan", scan), ("prefix", rollup.period_totals)]:
+        started = time.perf_counter()
+        results = [summarize(start, end) for start, end in periods]
+        elapsed = time.perf_counter() - started
+        print(f"summary {label:>10} rows={size:>8} {elapsed / queries * 1000:10.3f} ms/query")
+
+    for start, end in periods:
+        expected, actual = scan(start, end), rollup.period_totals(start, end)
+        if expected.balance_summary() != actual.balance_summary() or expected.pln_balance != actual.pln_balance:
+            raise SystemExit(f"итоги за {start} - {end} расходятся")
+
+
+# Прежний способ: обычная книга, новый Font и поиск ячейки на каждую строку
+def legacy_render(orders, output):
+    wb = Workbook()
+    details_sheet = wb.create_sheet(title="Детали ордеров")
+    details_sheet.append(["Дата", "Номер ордера", "Cash, PLN", "PLN total", "Cash, USD", "Cash, EUR", "Card", "Currency", "Comment"])
+    details_sheet.column_dimensions['A'].width = 15
+    pln_total = 0
+    for order in orders:
+        sum_value = round(order.amount / 100, 2)
+        is_cash = order.payment_type == "Cash-in-showroom"
+        cash_pln = sum_value if is_cash and order.currency == "PLN" else 0
+        pln_total = round(pln_total + cash_pln, 2)
+        details_sheet.append([
+            order.moment.split(' ')[0], order.name, cash_pln, pln_total,
+            sum_value if is_cash and order.currency == "USD" else "",
+            sum_value if is_cash and order.currency == "EUR" else "",
+            sum_value if order.payment_type == "Card-in-showroom" else "",
+            order.currency, order.comment
+        ])
+        pln_total_cell = details_sheet.cell(row=details_sheet.max_row, column=4)
+        if pln_total < 0:
+            pln_total_cell.font = Font(color="FF0000")
+        else:
+            pln_total_cell.font = Font(color="000000")
+    wb.remove(wb["Sheet"])
+    wb.save(output)
+    return output
+
+
+# Прежний подсчёт итогов: float и round на каждом накоплении
+def legacy_totals(orders):
+    balance = {currency: {'cash': 0, 'card': 0, 'count': 0} for currency in CURRENCIES}
+    ledger = {currency: {"cash": 0, "card": 0, "count": 0, "test_count": 0} for currency in CURRENCIES}
+    payment_type_mapping = {"Card-in-showroom": "card", "Cash-in-showroom": "cash"}
+    pln_total = 0
+    for order in orders:
+        currency = order.currency
+        if not currency:
+            continue
+        sum_value = round(order.amount / 100, 2)
+        payment_type = payment_type_mapping.get(order.payment_type)
+        balance[currency]['count'] += 1
+        if payment_type:
+            balance[currency][payment_type] = round(balance[currency][payment_type] + sum_value, 2)
+            if order.test_order:
+                ledger[currency]["test_count"] += 1
+            else:
+                ledger[currency][payment_type] += sum_value
+                ledger[currency]["count"] += 1
+        if payment_type == "cash" and currency == "PLN":
+            pln_total = round(pln_total + sum_value, 2)
+    return (
+        [(currency, data['cash'], data['card'], data['count']) for currency, data in balance.items()],
+        [(currency, round(data['cash'], 2), round(data['card'], 2), data['count'], data['test_count'])
+         for currency, data in ledger.items()],
+        pln_total
+    )
+
+
+def vectorized_totals(orders):
+    totals = Totals()
+    for chunk in iter_chunks(orders):
+        totals.add(OrderColumns(chunk))
+    return (
+        [(currency, as_money(cash), as_money(card), count) for currency, cash, card, count in totals.balance_summary()],
+        [(currency, as_money(cash), as_money(card), count, test_count)
+         for currency, cash, card, count, test_count in totals.ledger_summary()],
+        as_money(totals.pln_balance)
+    )
+
+
+def bench_aggregate(sizes, fixture_rows):
+    # Общая фикстура: итоги должны совпасть с прежним подсчётом до копейки
+    fixture = list(synthetic_orders(fixture_rows))
+    expected, actual = legacy_totals(fixture), vectorized_totals(fixture)
+    if expected != actual:
+        raise SystemExit(f"итоги расходятся:\n{expected}\n{actual}")
+    print(f"aggregate fixture rows={fixture_rows}: итоги совпадают")
+
+    for size in sizes:
+        orders = list(synthetic_orders(size))
+        for label, aggregate in [("legacy", legacy_totals), ("vectorized", vectorized_totals)]:
+            started = time.perf_counter()
+            aggregate(orders)
+            elapsed = time.perf_counter() - started
+            print(f"aggregate {label:>10} rows={size:>8} {elapsed:8.3f}s {size / elapsed:12.0f} rows/s")
+
+
+def bench_render(sizes, legacy_max_rows):
+    for size in sizes:
+        for label, render in [("legacy", legacy_render), ("write-only", write_balance_report)]:
+            if render is legacy_render and size > legacy_max_rows:
+                # max_row обходит все ячейки листа, поэтому прежний способ квадратичен по числу строк
+                print(f"render {label:>10} rows={size:>8} пропущено: квадратичное время, см. --legacy-max-rows")
+                continue
+            started = time.perf_counter()
+            output = render(synthetic_orders(size), BytesIO())
+            elapsed = time.perf_counter() - started
+            print(f"render {label:>10} rows={size:>8} {elapsed:8.2f}s {size / elapsed:10.0f} rows/s {output.tell() / 2**20:7.1f} MiB")
+
+
+def write_text_csv(orders, output):
+    text = TextIOWrapper(output, encoding="utf-8", newline="")
+    write_csv("balance", orders, text)
+    text.flush()
+    return text.detach()
+
+
+def bench_export(sizes, xlsx_max_rows):
+    for size in sizes:
+        orders = list(dataset_orders(synthetic_dataset(size)))
+        writers = [
+            ("xlsx", write_balance_report),
+            ("csv", write_text_csv),
+            ("parquet", lambda orders, output: write_parquet("balance", orders, output))
+        ]
+        for label, write in writers:
+            if label == "xlsx" and size > xlsx_max_rows:
+                print(f"export {label:>8} rows={size:>8} пропущено, см. --xlsx-max-rows")
+                continue
+            started = time.perf_counter()
+            output = write(orders, BytesIO())
+            elapsed = time.perf_counter() - started
+            print(f"export {label:>8} rows={size:>8} {elapsed:8.2f}s {size / elapsed:10.0f} rows/s {output.tell() / 2**20:7.1f} MiB")
+
+
+# Отчёт за всю историю: целиком через openpyxl, из кусков по месяцам
+# с пустым кэшем, после новых ордеров в текущем месяце (перестраивается
+# только он) и, для сравнения, отчёт только за текущий месяц
+def bench_months(sizes, full_max_rows):
+    for size in sizes:
+        orders = list(dataset_orders(synthetic_dataset(size)))
+        start = datetime.fromisoformat(orders[0].moment[:10])
+        end = datetime.fromisoformat(orders[-1].moment[:10]) + timedelta(days=1, microseconds=-1)
+        current = datetime(end.year, end.month, 1)
+        index = OrderIndex(orders)
+        fragments = ReportCache(max_entries=10_000, max_bytes=2**31, ttl=86400)
+        # Новые ордера текущего месяца — новая версия индекса, как после синхронизации
+        added = OrderIndex(orders + [
+            CashOrder(f"{end:%Y-%m-%d} 23:59:59", f"new-{number}", 100, "PLN", "Cash-in-showroom", False, INCOME, "")
+            for number in range(10)
+        ])
+        runs = [
+            ("full", lambda: (render_report(index, "balance", start, end), len(orders))),
+            ("cold", lambda: render_month_report(index, "balance", start, end, fragments)),
+            ("changed", lambda: render_month_report(added, "balance", start, end, fragments)),
+            ("month", lambda: (render_report(added, "balance", current, end), len(added.select(current, end))))
+        ]
+        for label, run in runs:
+            if label == "full" and size > full_max_rows:
+                print(f"months {label:>8} rows={size:>8} пропущено, см. --full-max-rows")
+                continue
+            started = time.perf_counter()
+            data, rendered = run()
+            elapsed = time.perf_counter() - started
+            print(f"months {label:>8} rows={size:>8} {elapsed:8.2f}s отрисовано {rendered:>8} {len(data) / 2**20:7.1f} MiB")
+
+
+# Содержимое книги для сравнения: по каждой ячейке каждого листа значение,
+# именованный стиль, цвет шрифта, заливка и формат числа
+def workbook_cells(data):
+    workbook = load_workbook(BytesIO(data))
+    return {
+        sheet.title: [
+            [(cell.value, cell.style, cell.font.color.rgb if cell.font.color else None,
+              cell.fill.fgColor.rgb, cell.number_format) for cell in row]
+            for row in sheet.iter_rows()
+        ]
+        for sheet in workbook.worksheets
+    }
+
+
+# Проверка: XLSX из кусков по месяцам совпадает с обычным отчётом ячейка
+# в ячейку для обоих видов отчёта — с пустым кэшем, повторно из готовых
+# кусков, за период с середины месяца и после изменения ордеров на месте
+def check_fragments(size):
+    orders = list(dataset_orders(synthetic_dataset(size)))
+    first = datetime.fromisoformat(orders[0].moment[:10])
+    last = datetime.fromisoformat(orders[-1].moment[:10]) + timedelta(days=1, microseconds=-1)
+    middle = first + (last - first) / 3
+    periods = [
+        ("history", first, last),
+        ("mid-month", datetime(middle.year, middle.month, 15), datetime(last.year, last.month, 10, 23, 59, 59))
+    ]
+    failures = []
+    for layout in LAYOUTS:
+        index = OrderIndex(orders)
+        fragments = ReportCache(max_entries=10_000, max_bytes=2**31, ttl=86400)
+        runs = [(f"{label} cold", start, end) for label, start, end in periods]
+        runs += [(f"{label} warm", start, end) for label, start, end in periods]
+        for label, start, end in runs + [("changed", first, last)]:
+            if label == "changed":
+                # Ордер в прошлом месяце, как от веб-хука: его месяц перестраивается
+                index.apply_changes([], [
+                    CashOrder(f"{middle:%Y-%m-%d} 12:00:00.000", "changed", -250, "PLN", "Cash-in-showroom", False, INCOME, "")
+                ])
+            metrics = RunMetrics("check")
+            stitched = render_report(index, layout, start, end, metrics=metrics, fragments=fragments)
+            expected = render_report(index, layout, start, end)
+            matches = workbook_cells(stitched) == workbook_cells(expected)
+            rendered = metrics.stages[-1].rows
+            print(f"fragments {layout:>8} {label:>15} отрисовано {rendered:>8} {'совпадает' if matches else 'РАСХОДИТСЯ'}")
+            if not matches:
+                failures.append(f"{layout} {label}")
+            if label == "history warm" and rendered:
+                failures.append(f"{layout} {label}: повторный отчёт отрисовал {rendered} строк вместо готовых кусков")
+    if failures:
+        raise SystemExit("отчёт из кусков расходится с обычным:\n" + "\n".join(failures))
+    print("отчёты из кусков совпадают с обычными")
+
+
+# Чего стоит свежесть данных перед отчётом: инкрементальная синхронизация
+# с заглушкой (запросы по updated и сверка количества) и пересборка индекса
+# против событий веб-хуков, которые применяются к хранилищу и индексу на месте
+def bench_webhooks(size, events, latency):
+    with tempfile.TemporaryDirectory() as directory:
+        store = OrderStore(os.path.join(directory, "orders.sqlite3"))
+        with MoySkladStub(size, latency=latency) as stub:
+            client = MoySkladClient("bench", "bench", base_url=stub.base_url)
+            store.sync(client)
+            started = time.perf_counter()
+            store.sync(client)
+            print(f"webhooks {'sync':>8} rows={size:>8} {time.perf_counter() - started:8.3f}s запросов {client.stats()['requests']}")
+
+        live = LiveIndex(store)
+        started = time.perf_counter()
+        index = live.current()
+        index.rollup
+        print(f"webhooks {'rebuild':>8} rows={size:>8} {time.perf_counter() - started:8.3f}s")
+
+        with WebhookReplay(synthetic_webhooks(synthetic_dataset(size), events)) as replay:
+            receiver = WebhookReceiver(store, MoySkladClient("bench", "bench", base_url=replay.base_url), live, token="bench")
+            receiver.serve("127.0.0.1", 0)
+            started = time.perf_counter()
+            replay.play(f"http://127.0.0.1:{receiver.port}/?token=bench", wait=receiver.wait_idle)
+            elapsed = time.perf_counter() - started
+            receiver.close()
+        in_place = live.current() is index
+        print(f"webhooks {'events':>8} rows={size:>8} {elapsed / events * 1000:8.2f} ms/событие "
+              f"событий {events} индекс на месте: {'да' if in_place else 'нет'}")
+
+
+# Сводный отчёт по нескольким аккаунтам: у каждого своя заглушка со своим
+# лимитом запросов. Аккаунты по очереди стоят сумму их времён, параллельно —
+# примерно время самого медленного
+def bench_accounts(sizes, latency, rate):
+    start, end = datetime(2000, 1, 1), datetime(2100, 1, 1)
+    stubs = [MoySkladStub(size, seed=number + 1, latency=latency, rate=rate).start() for number, size in enumerate(sizes)]
+    try:
+        def consolidate(accounts):
+            started = time.perf_counter()
+            metrics = RunMetrics("consolidated")
+            group = AccountGroup(accounts)
+            group.sync(metrics)
+            group.render("balance", start, end, metrics)
+            return time.perf_counter() - started, metrics
+
+        with tempfile.TemporaryDirectory() as directory:
+            accounts = [
+                Account(f"showroom{number}", "bench", "bench", os.path.join(directory, f"single{number}.sqlite3"), base_url=stub.base_url)
+                for number, stub in enumerate(stubs)
+            ]
+            single = [consolidate([account])[0] for account in accounts]
+            for account, size, elapsed in zip(accounts, sizes, single):
+                print(f"accounts {account.name:>10} rows={size:>8} {elapsed:8.2f}s")
+
+            accounts = [
+                Account(f"showroom{number}", "bench", "bench", os.path.join(directory, f"all{number}.sqlite3"), base_url=stub.base_url)
+                for number, stub in enumerate(stubs)
+            ]
+            elapsed, metrics = consolidate(accounts)
+        stages = ", ".join(f"{stage.name} {stage.seconds:.2f}s" for stage in metrics.stages)
+        print(f"accounts {'parallel':>10} rows={sum(sizes):>8} {elapsed:8.2f}s ({stages}); "
+              f"по очереди {sum(single):.2f}s, самый медленный {max(single):.2f}s")
+    finally:
+        for stub in stubs:
+            stub.stop()
+
+
+# Модули, без которых первая отрисовка приложения должна обходиться:
+# они нужны только после нажатия кнопки отчёта
+HEAVY_MODULES = ("requests", "openpyxl", "numpy", "pyarrow", "pandas", "xlsx_render", "report", "report_core", "moysklad")
+
+# Выполняется в свежем интерпретаторе: импорт streamlit, затем первый
+# прогон скрипта приложения через AppTest — всё, что нужно до первой отрисовки
+STARTUP_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+imported = time.perf_counter()
+before = set(sys.modules)
+app = AppTest.from_file(sys.argv[1], default_timeout=120)
+app.secrets["username"] = "bench"
+app.secrets["password"] = "bench"
+app.secrets["store_path"] = sys.argv[2]
+app.run()
+rendered = time.perf_counter()
+assert not app.exception, app.exception
+loaded = set(sys.modules) - before
+print(json.dumps({
+    "streamlit": imported - started,
+    "script": rendered - imported,
+    "modules": len(loaded),
+    "heavy": [name for name in sys.argv[3:] if name in loaded]
+}))
+"""
+
+
+# Время до первой отрисовки приложения в новом процессе: запуск
+# интерпретатора, импорт streamlit и первый прогон скрипта. Берётся лучший
+# из repeats запусков; heavy — тяжёлые модули, загруженные скриптом
+def bench_startup(apps, repeats):
+    with tempfile.TemporaryDirectory() as directory:
+        for app in apps:
+            runs = []
+            for _ in range(repeats):
+                started = time.perf_counter()
+                output = subprocess.run(
+                    [sys.executable, "-c", STARTUP_PROBE, app, os.path.join(directory, "orders.sqlite3"), *HEAVY_MODULES],
+                    capture_output=True, text=True, check=True
+                ).stdout
+                result = json.loads(output.splitlines()[-1])
+                result["total"] = time.perf_counter() - started
+                runs.append(result)
+            best = min(runs, key=lambda result: result["total"])
+            print(f"startup {app:>10} {best['total']:6.2f}s всего, streamlit {best['streamlit']:5.2f}s, "
+                  f"скрипт {best['script']:5.2f}s, модулей {best['modules']:>5}, "
+                  f"тяжёлые: {', '.join(best['heavy']) or 'нет'}")
+
+
+# Прежняя загрузка: полные документы и response.json()
+def legacy_fetch(base_url, order_type, encoding):
+    session = requests.Session()
+    pages, wire_bytes, decode_seconds = 0, 0, 0.0
+    offset, size = 0, 1
+    while offset < size:
+        response = session.get(f"{base_url}/{order_type}", params={"limit": PAGE_LIMIT, "offset": offset},
+                               headers={"Accept-Encoding": encoding})
+        content = response.content
+        started = time.perf_counter()
+        size = response.json()["meta"]["size"]
+        decode_seconds += time.perf_counter() - started
+        wire_bytes += response.raw.tell() or len(content)
+        pages += 1
+        offset += PAGE_LIMIT
+    return pages, wire_bytes, decode_seconds
+
+
+def client_fetch(base_url, order_type):
+    client = MoySkladClient("bench", "bench", base_url=base_url, concurrency=1)
+    offset, size = 0, 1
+    while offset < size:
+        size = client.get_page(order_type, offset)["meta"]["size"]
+        offset += PAGE_LIMIT
+    stats = client.stats()
+    return stats["pages"], stats["wire_bytes"], stats["decode_seconds"]
+
+
+def bench_fetch(size):
+    with MoySkladStub(size) as stub:
+        runs = [
+            ("identity", lambda: legacy_fetch(stub.base_url, "cashin", "identity")),
+            ("gzip+json", lambda: legacy_fetch(stub.base_url, "cashin", "gzip")),
+            ("client", lambda: client_fetch(stub.base_url, "cashin"))
+        ]
+        for label, fetch in runs:
+            started = time.perf_counter()
+            pages, wire_bytes, decode_seconds = fetch()
+            elapsed = time.perf_counter() - started
+            print(f"fetch {label:>10} pages={pages:>5} {wire_bytes / pages / 2**10:8.1f} KiB/page "
+                  f"{decode_seconds / pages * 1000:7.2f} ms/page разбор {elapsed:7.2f}s всего")
+
+
+# Этапы набора замеров. Каждый получает подготовленные данные и возвращает
+# число обработанных строк; время и пик памяти снимаются вокруг вызова
+def stage_fetch(base_url, orders, concurrency):
+    client = MoySkladClient("bench", "bench", base_url=base_url, concurrency=concurrency)
+    fetched = [
+        parse_order(row, order_type)
+        for order_type, _, rows in client.iter_pages({order_type: "applicable=true" for order_type in CASH_ORDER_TYPES})
+        for row in rows
+    ]
+    return len(fetched)
+
+
+def stage_filter(base_url, orders, concurrency):
+    index = OrderIndex(orders)
+    # Отчёты за каждый месяц всего периода данных
+    first = datetime.fromisoformat(orders[0].moment[:10])
+    last = datetime.fromisoformat(orders[-1].moment[:10])
+    month = datetime(first.year, first.month, 1)
+    while month <= last:
+        following = datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+        index.select(month, following - timedelta(microseconds=1))
+        month = following
+    return len(index)
+
+
+def stage_aggregate(base_url, orders, concurrency):
+    totals = Totals()
+    for chunk in iter_chunks(orders):
+        totals.add(OrderColumns(chunk))
+    DailyRollup(orders)
+    return len(orders)
+
+
+def stage_render(base_url, orders, concurrency):
+    write_balance_report(orders, BytesIO())
+    return len(orders)
+
+
+SUITE_STAGES = {
+    "fetch": stage_fetch,
+    "filter": stage_filter,
+    "aggregate": stage_aggregate,
+    "render": stage_render
+}
+
+
+# Короткие этапы повторяются, пока суммарное время меньше этого порога;
+# в результат идёт лучший прогон
+MIN_STAGE_SECONDS = 1.0
+
+
+STATUS_FIELD = re.compile(r"^(VmHWM|VmRSS):\s+(\d+) kB", re.MULTILINE)
+
+
+def read_status():
+    with open("/proc/self/status") as status:
+        return {name: int(value) * 1024 for name, value in STATUS_FIELD.findall(status.read())}
+
+
+# Пиковый прирост памяти процесса за время блока with. В Linux пик RSS
+# сбрасывается записью в /proc/self/clear_refs, в других системах берётся
+# пик выделений Python по tracemalloc. Пик общий на процесс, поэтому замер
+# только для этапов набора, каждый из которых идёт в своём процессе
+class PeakMemory:
+    def __init__(self):
+        self.peak_bytes = 0
+        self._rss_at_start = None
+
+    def __enter__(self):
+        try:
+            with open("/proc/self/clear_refs", "w") as clear_refs:
+                clear_refs.write("5")
+            self._rss_at_start = read_status()["VmRSS"]
+        except OSError:
+            self._rss_at_start = None
+            tracemalloc.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._rss_at_start is None:
+            _, self.peak_bytes = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        else:
+            self.peak_bytes = max(0, read_status()["VmHWM"] - self._rss_at_start)
+
+
+# Один этап в отдельном процессе: пик памяти не искажается тем, что
+# аллокатор удерживает память, освобождённую предыдущими этапами
+def measure_stage(stage, size, base_url, concurrency):
+    orders = [] if stage == "fetch" else list(dataset_orders(synthetic_dataset(size)))
+    gc.collect()
+    timings = []
+    with PeakMemory() as memory:
+        started = time.perf_counter()
+        rows = SUITE_STAGES[stage](base_url, orders, concurrency)
+        timings.append(time.perf_counter() - started)
+    while sum(timings) < MIN_STAGE_SECONDS and len(timings) < 20:
+        started = time.perf_counter()
+        SUITE_STAGES[stage](base_url, orders, concurrency)
+        timings.append(time.perf_counter() - started)
+    elapsed = min(timings)
+    return {
+        "rows": rows,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed),
+        "peak_mib": round(memory.peak_bytes / 2**20, 1)
+    }
+
+
+def run_suite(sizes, stages, latency, rate, concurrency):
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for size in sizes:
+        with MoySkladStub(size, latency=latency, rate=rate) as stub:
+            for stage in stages:
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    result = pool.submit(measure_stage, stage, size, stub.base_url, concurrency).result()
+                results[f"{stage}@{size}"] = result
+                print(f"suite {stage:>10} rows={result['rows']:>8} {result['seconds']:8.2f}s "
+                      f"{result['rows_per_second']:10} rows/s {result['peak_mib']:8.1f} MiB пик")
+    return results
+
+
+# Регрессия — падение пропускной способности или рост пика памяти больше
+# чем на threshold относительно базовой линии. Пик памяти меньше пары мегабайт
+# не сравниваем: это шум аллокатора
+def find_regressions(results, baseline, threshold):
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if result["rows_per_second"] < base["rows_per_second"] * (1 - threshold):
+            regressions.append(f"{key}: {result['rows_per_second']} rows/s, базовая линия {base['rows_per_second']}")
+        if result["peak_mib"] > max(base["peak_mib"], 2.0) * (1 + threshold):
+            regressions.append(f"{key}: пик {result['peak_mib']} MiB, базовая линия {base['peak_mib']}")
+    return regressions
+
+
+def bench_suite(args):
+    results = run_suite(args.rows, args.stages, args.latency, args.rate, args.concurrency)
+    if args.save_baseline:
+        with open(args.baseline, "w") as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+        print(f"базовая линия записана в {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"базовой линии {args.baseline} нет, сравнение пропущено (см. --save-baseline)")
+        return
+    with open(args.baseline) as baseline:
+        regressions = find_regressions(results, json.load(baseline), args.threshold)
+    if regressions:
+        raise SystemExit("регрессия производительности:\n" + "\n".join(regressions))
+    print(f"регрессий нет (порог {args.threshold:.0%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры производительности отчёта")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    render = subparsers.add_parser("render", help="скорость записи листа деталей в XLSX")
+    render.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    render.add_argument("--legacy-max-rows", type=int, default=20_000,
+                        help="прежний способ замеряется только до этого числа строк")
+
+    aggregate = subparsers.add_parser("aggregate", help="итоги по валютам и остаток PLN")
+    aggregate.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    aggregate.add_argument("--fixture-rows", type=int, default=50_000)
+
+    ingest = subparsers.add_parser("ingest", help="разбор документов API в записи ордеров")
+    ingest.add_argument("--rows", type=int, default=200_000)
+
+    select = subparsers.add_parser("select", help="выборка ордеров за период")
+    select.add_argument("--rows", type=int, default=200_000)
+    select.add_argument("--queries", type=int, default=20)
+
+    summary = subparsers.add_parser("summary", help="сводка за период по итогам за дни")
+    summary.add_argument("--rows", type=int, default=500_000)
+    summary.add_argument("--queries", type=int, default=50)
+
+    fetch = subparsers.add_parser("fetch", help="объём ответов API на проводе и время их разбора")
+    fetch.add_argument("--rows", type=int, default=50_000)
+
+    export = subparsers.add_parser("export", help="детали балансового отчёта в XLSX, CSV и Parquet")
+    export.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    export.add_argument("--xlsx-max-rows", type=int, default=1_000_000)
+
+    months = subparsers.add_parser("months", help="отчёт за всю историю из кусков по месяцам")
+    months.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    months.add_argument("--full-max-rows", type=int, default=100_000,
+                        help="полный отчёт через openpyxl замеряется только до этого числа строк")
+
+    fragments = subparsers.add_parser("fragments", help="проверка: отчёт из кусков по месяцам совпадает с обычным")
+    fragments.add_argument("--rows", type=int, default=20_000)
+
+    webhooks = subparsers.add_parser("webhooks", help="синхронизация перед отчётом против событий веб-хуков")
+    webhooks.add_argument("--rows", type=int, default=100_000)
+    webhooks.add_argument("--events", type=int, default=500)
+    webhooks.add_argument("--latency", type=float, default=0.05, help="задержка ответа заглушки, секунды")
+
+    accounts = subparsers.add_parser("accounts", help="сводный отчёт по нескольким аккаунтам: параллельно против по очереди")
+    accounts.add_argument("--rows", type=int, nargs="+", default=[20_000, 12_000, 6_000],
+                          help="документов в каждом аккаунте")
+    accounts.add_argument("--latency", type=float, default=1.0, help="задержка ответа заглушки, секунды")
+    accounts.add_argument("--rate", type=float, default=15, help="лимит запросов каждой заглушки в секунду")
+
+    startup = subparsers.add_parser("startup", help="время до первой отрисовки приложений Streamlit")
+    startup.add_argument("--apps", nargs="+", default=["testy.py", "app6.py"])
+    startup.add_argument("--repeats", type=int, default=5)
+
+    suite = subparsers.add_parser("suite", help="этапы fetch/filter/aggregate/render на синтетических данных с порогом регрессии")
+    suite.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    suite.add_argument("--stages", nargs="+", choices=list(SUITE_STAGES), default=list(SUITE_STAGES))
+    suite.add_argument("--latency", type=float, default=0.0, help="задержка ответа заглушки, секунды")
+    suite.add_argument("--rate", type=float, default=None, help="лимит запросов заглушки в секунду")
+    suite.add_argument("--concurrency", type=int, default=5)
+    suite.add_argument("--baseline", default="bench_baseline.json")
+    suite.add_argument("--save-baseline", action="store_true", help="записать результаты как базовую линию")
+    suite.add_argument("--threshold", type=float, default=0.2, help="допустимое ухудшение, доля")
+
+    args = parser.parse_args()
+    if args.command == "render":
+        bench_render(args.rows, args.legacy_max_rows)
+    elif args.command == "aggregate":
+        bench_aggregate(args.rows, args.fixture_rows)
+    elif args.command == "ingest":
+        bench_ingest(args.rows)
+    elif args.command == "select":
+        bench_select(args.rows, args.queries)
+    elif args.command == "summary":
+        bench_summary(args.rows, args.queries)
+    elif args.command == "fetch":
+        bench_fetch(args.rows)
+    elif args.command == "export":
+        bench_export(args.rows, args.xlsx_max_rows)
+    elif args.command == "months":
+        bench_months(args.rows, args.full_max_rows)
+    elif args.command == "fragments":
+        check_fragments(args.rows)
+    elif args.command == "webhooks":
+        bench_webhooks(args.rows, args.events, args.latency)
+    elif args.command == "accounts":
+        bench_accounts(args.rows, args.latency, args.rate)
+    elif args.command == "startup":
+        bench_startup(args.apps, args.repeats)
+    elif args.command == "suite":
+        bench_suite(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import RunMetrics
+from moysklad import BASE_URL, DEFAULT_CONCURRENCY, DEFAULT_TIMEOUT, MoySkladClient
+from order_index import LiveIndex
+from order_store import OrderStore
+from report import build_consolidated_balance_summary, build_consolidated_ledger_summary
+from report_core import sync_store
+from report_jobs import STAGE_AGGREGATE, STAGE_SYNC
+
+# Вид отчёта -> сводный лист по нескольким аккаунтам
+CONSOLIDATED_SUMMARIES = {
+    "balance": build_consolidated_balance_summary,
+    "ledger": build_consolidated_ledger_summary
+}
+
+
+# Аккаунт МоегоСклада (шоурум). Лимиты API считаются на пользователя,
+# поэтому у каждого аккаунта свой клиент: своя сессия с пулом соединений
+# и свой планировщик запросов. Хранилище и индекс тоже свои
+class Account:
+    def __init__(self, name, username, password, store_path=None, base_url=BASE_URL, concurrency=DEFAULT_CONCURRENCY,
+                 timeout=DEFAULT_TIMEOUT):
+        self.name = name
+        self.client = MoySkladClient(username, password, base_url=base_url, concurrency=concurrency, timeout=timeout)
+        self.store = OrderStore(store_path or f"orders_{name}.sqlite3")
+        self.live_index = LiveIndex(self.store)
+
+
+# Аккаунты сводного отчёта. Каждый аккаунт синхронизируется в своём потоке:
+# время уходит в основном на ожидание API, поэтому общее время — примерно
+# время самого медленного аккаунта, а не сумма
+class AccountGroup:
+    def __init__(self, accounts):
+        self.accounts = accounts
+
+    # work(account) для всех аккаунтов сразу, результаты в порядке accounts
+    def _map(self, work):
+        with ThreadPoolExecutor(max_workers=max(1, len(self.accounts)), thread_name_prefix="account") as executor:
+            return list(executor.map(work, self.accounts))
+
+    # В metrics пишется общий этап sync; возвращаются метрики каждого
+    # аккаунта. progress(страниц, всего) — по всем аккаунтам вместе
+    def sync(self, metrics, max_age=0, progress=None):
+        lock = threading.Lock()
+        pages = {}
+
+        def sync_account(account):
+            def on_pages(done, total):
+                with lock:
+                    pages[account.name] = (done, total)
+                    if progress is not None:
+                        progress(sum(done for done, _ in pages.values()), sum(total for _, total in pages.values()))
+
+            account_metrics = RunMetrics("account", memory=metrics.memory, account=account.name)
+            sync_store(account.store, account.client, account_metrics, max_age=max_age, progress=on_pages)
+            return account_metrics
+
+        with metrics.stage("sync") as stage:
+            account_metrics = self._map(sync_account)
+        synced = [run.stages[0] for run in account_metrics]
+        stage.rows = sum(synced_stage.rows for synced_stage in synced)
+        stage.requests = sum(synced_stage.requests for synced_stage in synced)
+        stage.bytes = sum(synced_stage.bytes for synced_stage in synced)
+        return account_metrics
+
+    # Версия данных всех аккаунтов — для ключа кэша отчётов
+    def revision(self):
+        return tuple(account.store.revision() for account in self.accounts)
+
+    # Итоги периода по каждому аккаунту из его итогов по дням:
+    # [(имя, Totals, ордеров в индексе)]. Индекс аккаунта пересобирается,
+    # только если его данные изменились
+    def totals(self, start_date, end_date):
+        def account_totals(account):
+            index = account.live_index.current()
+            with index.lock:
+                return account.name, index.rollup.period_totals(start_date, end_date), len(index)
+
+        return self._map(account_totals)
+
+    # Сводный лист по уже синхронизированным аккаунтам: итоги каждого
+    # аккаунта и итог по всем вместе
+    def render(self, layout, start_date, end_date, metrics=None):
+        if metrics is None:
+            metrics = RunMetrics("consolidated")
+        with metrics.stage("index") as stage:
+            results = self.totals(start_date, end_date)
+            stage.rows = sum(rows for _, _, rows in results)
+        with metrics.stage("summary") as stage:
+            data = CONSOLIDATED_SUMMARIES[layout]([(name, totals) for name, totals, _ in results]).getvalue()
+            stage.bytes = len(data)
+        return data
+
+    # Запросы, повторы и отказы по лимиту всех аккаунтов
+    def stats(self):
+        stats = [account.client.stats() for account in self.accounts]
+        return {name: sum(account_stats[name] for account_stats in stats) for name in ("requests", "retries", "throttled")}
+
+
+# Задание сводного отчёта для приложений: аккаунты синхронизируются
+# параллельно, итоги каждого берутся из его итогов по дням и сводятся
+# на один лист. Параметры — как у report_core.run_report_job
+def run_consolidated_job(job, layout, accounts, report_cache, start_date, end_date, sync_interval=0, metrics_path=None,
+                         memory=False):
+    metrics = job.metrics = RunMetrics(
+        "consolidated", memory=memory, layout=layout, accounts=len(accounts.accounts), start=start_date.date(),
+        end=end_date.date(), cache="hit"
+    )
+    job.stage = STAGE_SYNC
+    account_metrics = accounts.sync(metrics, max_age=sync_interval, progress=job.on_pages)
+
+    def render():
+        metrics.labels["cache"] = "miss"
+        job.stage = STAGE_AGGREGATE
+        return accounts.render(layout, start_date, end_date, metrics)
+
+    key = ("consolidated", layout, start_date, end_date, accounts.revision())
+    data = report_cache.get_or_create(key, render)
+    for run in (*account_metrics, metrics):
+        run.record(metrics_path)
+    return data
@@ -0,0 +1,163 @@
+import csv
+from io import BytesIO, TextIOWrapper
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from aggregate import OrderColumns, Totals
+from records import CURRENCIES, EXPENSE, INCOME
+from report import CHUNK_SIZE, LEDGER_PAYMENT_TYPES, iter_chunks
+
+# Группа строк Parquet: крупнее пачки XLSX, чтобы столбцы хорошо сжимались
+PARQUET_CHUNK_SIZE = 100_000
+
+# Колонки деталей; суммы в копейках целыми числами. pln_total — остаток
+# наличных PLN после строки, есть только в балансовом отчёте
+DETAIL_FIELDS = ["date", "moment", "name", "amount", "currency", "payment_type", "doc_type", "test_order", "comment"]
+
+# Категории словарных колонок фиксированы, чтобы коды совпадали во всех группах строк
+CATEGORY_TYPE = pa.dictionary(pa.int8(), pa.string())
+CATEGORIES = {
+    "currency": pa.array(CURRENCIES),
+    "doc_type": pa.array([INCOME, EXPENSE])
+}
+
+# Тип платежа — открытый набор строк (не только PAYMENT_TYPES), поэтому
+# словарь у каждой группы строк свой, из встретившихся значений
+PAYMENT_TYPE = pa.dictionary(pa.int32(), pa.string())
+
+
+def detail_fields(layout):
+    return DETAIL_FIELDS + ["pln_total"] if layout == "balance" else DETAIL_FIELDS
+
+
+def detail_schema(layout):
+    fields = [
+        ("date", pa.date32()),
+        ("moment", pa.timestamp("ms")),
+        ("name", pa.string()),
+        ("amount", pa.int64()),
+        ("currency", CATEGORY_TYPE),
+        ("payment_type", PAYMENT_TYPE),
+        ("doc_type", CATEGORY_TYPE),
+        ("test_order", pa.bool_()),
+        ("comment", pa.string())
+    ]
+    if layout == "balance":
+        fields.append(("pln_total", pa.int64()))
+    return pa.schema(fields)
+
+
+def summary_fields(layout):
+    fields = ["currency", "cash", "card", "count"]
+    return fields + ["test_count"] if layout == "ledger" else fields
+
+
+def summary_rows(layout, totals):
+    return totals.ledger_summary() if layout == "ledger" else totals.balance_summary()
+
+
+# Детали пачками: те же ордера, что попадают в лист «Детали ордеров»
+# соответствующего XLSX, и остаток наличных PLN после каждого из них
+def iter_detail_chunks(layout, orders, opening_pln_balance=0, size=CHUNK_SIZE, progress=None):
+    totals = Totals(opening_pln_balance)
+    for chunk in iter_chunks(orders, size, progress):
+        running = totals.add(OrderColumns(chunk))
+        if layout == "ledger":
+            keep = [i for i, order in enumerate(chunk) if order.currency and order.payment_type in LEDGER_PAYMENT_TYPES]
+        else:
+            keep = [i for i, order in enumerate(chunk) if order.currency]
+        yield [chunk[i] for i in keep], running[keep]
+
+
+# CSV пишется построчно прямо в текстовый поток output
+def write_csv(layout, orders, output, opening_pln_balance=0, progress=None):
+    writer = csv.writer(output)
+    writer.writerow(detail_fields(layout))
+    balance = layout == "balance"
+    for chunk, running in iter_detail_chunks(layout, orders, opening_pln_balance, progress=progress):
+        for order, pln_total in zip(chunk, running.tolist()):
+            row = [
+                order.moment[:10], order.moment, order.name, order.amount, order.currency,
+                order.payment_type or "", order.doc_type, "true" if order.test_order else "false", order.comment
+            ]
+            if balance:
+                row.append(pln_total)
+            writer.writerow(row)
+    return output
+
+
+def write_summary_csv(layout, totals, output):
+    writer = csv.writer(output)
+    writer.writerow(summary_fields(layout))
+    writer.writerows(summary_rows(layout, totals))
+    return output
+
+
+def categorical(values, categories):
+    index = {value: code for code, value in enumerate(categories.to_pylist())}
+    codes = pa.array([index.get(value) for value in values], pa.int8())
+    return pa.DictionaryArray.from_arrays(codes, categories)
+
+
+def detail_table(layout, chunk, running):
+    moments = pa.array([order.moment for order in chunk], pa.string())
+    columns = [
+        pc.utf8_slice_codeunits(moments, 0, 10).cast(pa.date32()),
+        moments.cast(pa.timestamp("ms")),
+        pa.array([order.name for order in chunk], pa.string()),
+        pa.array(np.fromiter((order.amount for order in chunk), np.int64, len(chunk))),
+        categorical([order.currency for order in chunk], CATEGORIES["currency"]),
+        pa.array([order.payment_type for order in chunk], pa.string()).dictionary_encode(),
+        categorical([order.doc_type for order in chunk], CATEGORIES["doc_type"]),
+        pa.array([order.test_order for order in chunk], pa.bool_()),
+        pa.array([order.comment for order in chunk], pa.string())
+    ]
+    if layout == "balance":
+        columns.append(pa.array(running, pa.int64()))
+    return pa.Table.from_arrays(columns, schema=detail_schema(layout))
+
+
+# Parquet с типизированными колонками, по группе строк на пачку:
+# в памяти одновременно только одна пачка
+def write_parquet(layout, orders, output, opening_pln_balance=0, progress=None):
+    with pq.ParquetWriter(output, detail_schema(layout), compression="zstd") as writer:
+        for chunk, running in iter_detail_chunks(layout, orders, opening_pln_balance, PARQUET_CHUNK_SIZE, progress):
+            writer.write_table(detail_table(layout, chunk, running))
+    return output
+
+
+def write_summary_parquet(layout, totals, output):
+    rows = summary_rows(layout, totals)
+    columns = [categorical([row[0] for row in rows], CATEGORIES["currency"])]
+    columns += [pa.array([row[i] for row in rows], pa.int64()) for i in range(1, len(rows[0]))]
+    pq.write_table(pa.Table.from_arrays(columns, names=summary_fields(layout)), output, compression="zstd")
+    return output
+
+
+# CSV в байтах: текстовая обёртка поверх BytesIO, строки кодируются по мере записи
+def csv_bytes(write):
+    output = BytesIO()
+    text = TextIOWrapper(output, encoding="utf-8", newline="")
+    write(text)
+    text.flush()
+    text.detach()
+    return output.getvalue()
+
+
+def build_csv(layout, orders, opening_pln_balance=0, progress=None):
+    return csv_bytes(lambda output: write_csv(layout, orders, output, opening_pln_balance, progress))
+
+
+def build_summary_csv(layout, totals):
+    return csv_bytes(lambda output: write_summary_csv(layout, totals, output))
+
+
+def build_parquet(layout, orders, opening_pln_balance=0, progress=None):
+    return write_parquet(layout, orders, BytesIO(), opening_pln_balance, progress).getvalue()
+
+
+def build_summary_parquet(layout, totals):
+    return write_summary_parquet(layout, totals, BytesIO()).getvalue()
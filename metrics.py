@@ -0,0 +1,104 @@
+import json
+import logging
+import re
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+logger = logging.getLogger("report_metrics")
+
+VM_RSS = re.compile(r"^VmRSS:\s+(\d+) kB", re.MULTILINE)
+
+
+# Текущий RSS процесса в байтах, None — если /proc нет (не Linux).
+# Только чтение: пик RSS процесса не сбрасывается, tracemalloc не включается
+def resident_bytes():
+    try:
+        with open("/proc/self/status") as status:
+            match = VM_RSS.search(status.read())
+    except OSError:
+        return None
+    return int(match.group(1)) * 1024 if match else None
+
+
+# Строки метрик в stderr, если приложение не настроило логирование само
+def enable_logging(level=logging.INFO):
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+        logger.addHandler(handler)
+    logger.setLevel(level)
+
+
+# Замер одного этапа: время, RSS в конце этапа (если замер памяти включён)
+# и то, что этап сообщил о себе
+class StageMetrics:
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.rss_bytes = None
+        self.rows = None
+        self.bytes = None
+        self.requests = None
+
+    def as_dict(self):
+        result = {"stage": self.name, "seconds": round(self.seconds, 4)}
+        if self.rss_bytes is not None:
+            result["rss_mib"] = round(self.rss_bytes / 2**20, 1)
+        for field in ("rows", "bytes", "requests"):
+            value = getattr(self, field)
+            if value is not None:
+                result[field] = value
+        return result
+
+
+# Метрики одного запуска отчёта по этапам. labels — параметры запуска
+# (вид отчёта, период, попадание в кэш), они попадают в каждую запись.
+# memory — записывать RSS процесса после каждого этапа; по умолчанию выключено
+class RunMetrics:
+    def __init__(self, name, memory=False, **labels):
+        self.name = name
+        self.memory = memory
+        self.labels = labels
+        self.started_at = time.time()
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        stage = StageMetrics(name)
+        started = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage.seconds = time.perf_counter() - started
+            if self.memory:
+                stage.rss_bytes = resident_bytes()
+            self.stages.append(stage)
+
+    def total_seconds(self):
+        return sum(stage.seconds for stage in self.stages)
+
+    def as_dict(self):
+        return {
+            "run": self.name,
+            "started_at": datetime.fromtimestamp(self.started_at, timezone.utc).isoformat(timespec="seconds"),
+            "seconds": round(self.total_seconds(), 4),
+            **self.labels,
+            "stages": [stage.as_dict() for stage in self.stages]
+        }
+
+    # Одна JSON-строка на запуск в лог report_metrics
+    def log(self):
+        logger.info(json.dumps(self.as_dict(), ensure_ascii=False, default=str))
+
+    # Дописывает запуск строкой JSON в файл: по нему можно следить
+    # за временем отчётов на длинном отрезке
+    def append_to(self, path):
+        with open(path, "a", encoding="utf-8") as output:
+            output.write(json.dumps(self.as_dict(), ensure_ascii=False, default=str) + "\n")
+
+    # В лог и, если задан path, в файл
+    def record(self, path=None):
+        self.log()
+        if path:
+            self.append_to(path)
@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+
+from payload import decode_document, decode_page
+from rate_limit import RequestScheduler
+
+BASE_URL = "https://api.moysklad.ru/api/remap/1.2/entity"
+
+# Максимальный размер страницы в API МоегоСклада
+PAGE_LIMIT = 1000
+
+# МойСклад допускает не более 5 параллельных запросов от одного пользователя
+DEFAULT_CONCURRENCY = 5
+
+CASH_ORDER_TYPES = ("cashin", "cashout")
+
+# (соединение, чтение ответа), секунды. Без таймаута зависшее соединение
+# навсегда держит поток и слот планировщика, а с ним и блокировку синхронизации
+DEFAULT_TIMEOUT = (5, 60)
+
+
+# Фильтр МоегоСклада: полуинтервал [lower, upper) и только проведённые документы
+def build_range_filter(lower, upper):
+    return ";".join([
+        f"moment>={lower:%Y-%m-%d %H:%M:%S}",
+        f"moment<{upper:%Y-%m-%d %H:%M:%S}",
+        "applicable=true"
+    ])
+
+
+class MoySkladClient:
+    def __init__(self, username, password, base_url=BASE_URL, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT):
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.timeout = timeout
+
+        # Одна сессия с пулом keep-alive соединений на все запросы
+        self.session = requests.Session()
+        self.session.auth = HTTPBasicAuth(username, password)
+        # МойСклад отдаёт сжатые ответы только при явном Accept-Encoding: gzip
+        self.session.headers["Accept-Encoding"] = "gzip"
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # Все запросы идут через планировщик с учётом лимитов аккаунта
+        self.scheduler = RequestScheduler(concurrency)
+
+        # Объём ответов на проводе (до распаковки) и время их разбора
+        self._payload_lock = threading.Lock()
+        self._payload = {'pages': 0, 'wire_bytes': 0, 'body_bytes': 0, 'decode_seconds': 0.0}
+
+    def get_page(self, order_type, offset, filters=None, limit=PAGE_LIMIT):
+        params = {
+            'limit': limit,
+            'offset': offset,
+            # Стабильный порядок нужен, чтобы страницы по offset не пересекались
+            'order': 'moment,asc'
+        }
+        if filters:
+            params['filter'] = filters
+        # Параметр expand не передаём: связанные сущности приходят одной ссылкой meta
+        url = f"{self.base_url}/{order_type}"
+        response = self.scheduler.send(lambda: self.session.get(url, params=params, timeout=self.timeout))
+        response.raise_for_status()
+        content = response.content
+        started = time.perf_counter()
+        data = decode_page(content)
+        elapsed = time.perf_counter() - started
+        with self._payload_lock:
+            self._payload['pages'] += 1
+            # tell() у ответа urllib3 — число байт, прочитанных из сокета, то есть сжатых
+            self._payload['wire_bytes'] += response.raw.tell() or len(content)
+            self._payload['body_bytes'] += len(content)
+            self._payload['decode_seconds'] += elapsed
+        return data
+
+    # Один документ по id (для веб-хуков): облегчённая строка или None,
+    # если документ уже удалён
+    def get_document(self, order_type, order_id):
+        url = f"{self.base_url}/{order_type}/{order_id}"
+        response = self.scheduler.send(lambda: self.session.get(url, timeout=self.timeout))
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return decode_document(response.content)
+
+    # Счётчики запросов, повторов и пропускной способности, объём и разбор ответов
+    def stats(self):
+        with self._payload_lock:
+            payload = dict(self._payload)
+        return {**self.scheduler.stats(), **payload}
+
+    # Количество документов по фильтру без загрузки строк
+    def count(self, order_type, filters=None):
+        return self.get_page(order_type, 0, filters, limit=1)['meta']['size']
+
+    # queries: {тип документа: фильтр}; отдаёт (тип документа, смещение, строки)
+    # по мере готовности страниц, без накопления всей выборки в памяти.
+    # progress(загружено страниц, всего страниц) вызывается после каждой страницы;
+    # общее число уточняется по meta.size первых страниц
+    def iter_pages(self, queries, progress=None):
+        pages_done, pages_total = 0, len(queries)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            # Первые страницы всех типов запрашиваются одновременно, по meta.size
+            # из первой страницы ставятся в очередь остальные смещения
+            pending = {
+                executor.submit(self.get_page, order_type, 0, filters): (order_type, 0)
+                for order_type, filters in queries.items()
+            }
+            backlog = deque()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    order_type, offset = pending.pop(future)
+                    data = future.result()
+                    if offset == 0:
+                        offsets = range(PAGE_LIMIT, data['meta']['size'], PAGE_LIMIT)
+                        backlog.extend((order_type, next_offset) for next_offset in offsets)
+                        pages_total += len(offsets)
+                    pages_done += 1
+                    if progress is not None:
+                        progress(pages_done, pages_total)
+                    yield order_type, offset, data['rows']
+                # В работе держим ограниченное число страниц, чтобы готовые
+                # ответы не копились быстрее, чем их успевают обработать
+                while backlog and len(pending) < 2 * self.concurrency:
+                    order_type, offset = backlog.popleft()
+                    future = executor.submit(self.get_page, order_type, offset, queries[order_type])
+                    pending[future] = (order_type, offset)
+
+    # queries: {тип документа: фильтр}; возвращает {тип документа: строки}
+    def fetch_many(self, queries):
+        pages = {order_type: {} for order_type in queries}
+        for order_type, offset, rows in self.iter_pages(queries):
+            pages[order_type][offset] = rows
+        return {
+            order_type: [row for offset in sorted(by_offset) for row in by_offset[offset]]
+            for order_type, by_offset in pages.items()
+        }
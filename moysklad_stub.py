@@ -0,0 +1,198 @@
+import argparse
+import gzip
+import json
+import multiprocessing
+import re
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from synthetic import synthetic_dataset
+
+# Страница в 1000 полных документов — около 3 МБ JSON; orjson кодирует её
+# на порядок быстрее, чтобы заглушка не становилась узким местом замера
+try:
+    from orjson import dumps
+except ImportError:
+    def dumps(value):
+        return json.dumps(value, ensure_ascii=False).encode()
+
+# Условие фильтра МоегоСклада: поле, оператор, значение
+FILTER_CONDITION = re.compile(r"(\w+)(>=|<=|!=|=|<|>)(.*)")
+
+
+# Лимит запросов как у МоегоСклада: ведро на burst запросов, пополняется
+# со скоростью rate в секунду; заголовки в миллисекундах
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Возвращает (пропустить ли запрос, заголовки ответа)
+    def take(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            headers = {
+                "X-RateLimit-Limit": str(self.burst),
+                "X-Lognex-Reset": str(int((self.burst - self.tokens) / self.rate * 1000))
+            }
+            if self.tokens < 1:
+                headers["X-Lognex-Retry-After"] = str(int((1 - self.tokens) / self.rate * 1000) + 1)
+                return False, headers
+            self.tokens -= 1
+            headers["X-RateLimit-Remaining"] = str(int(self.tokens))
+            return True, headers
+
+
+# Срез строк набора под фильтр. Все документы проведены, updated растёт
+# вместе с moment, поэтому границы по обоим полям ищутся bisect по moment
+def filter_range(orders, filters):
+    start, stop = 0, len(orders)
+    for condition in filter(None, (filters or "").split(";")):
+        field, operator, value = FILTER_CONDITION.match(condition).groups()
+        if field == "applicable":
+            if value != "true":
+                start = stop
+            continue
+        if field not in ("moment", "updated"):
+            raise ValueError(f"фильтр по полю {field} не поддерживается")
+        if operator == ">=":
+            start = max(start, bisect_left(orders.moments, value))
+        elif operator == ">":
+            start = max(start, bisect_left(orders.moments, value + "\uffff"))
+        elif operator == "<":
+            stop = min(stop, bisect_left(orders.moments, value))
+        elif operator == "<=":
+            stop = min(stop, bisect_left(orders.moments, value + "\uffff"))
+        else:
+            raise ValueError(f"оператор {operator} не поддерживается")
+    return start, max(start, stop)
+
+
+def make_handler(dataset, latency, bucket, counters):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Заголовки и тело уходят отдельными записями; без этого задержанный ACK добавляет ~40 мс к ответу
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def send_body(self, status, body, headers=()):
+            self.send_response(status)
+            for name, value in headers:
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            order_type = url.path.rstrip("/").rsplit("/", 1)[-1]
+            query = {name: values[0] for name, values in parse_qs(url.query).items()}
+            with counters["lock"]:
+                counters["requests"] += 1
+            if latency:
+                time.sleep(latency)
+
+            headers = []
+            if bucket is not None:
+                allowed, limit_headers = bucket.take()
+                headers.extend(limit_headers.items())
+                if not allowed:
+                    with counters["lock"]:
+                        counters["throttled"] += 1
+                    body = dumps({"errors": [{"error": "Превышено ограничение на количество запросов", "code": 1049}]})
+                    self.send_body(429, body, headers + [("Content-Type", "application/json")])
+                    return
+
+            orders = dataset.get(order_type)
+            if orders is None:
+                self.send_body(404, b"", headers)
+                return
+            try:
+                start, stop = filter_range(orders, query.get("filter"))
+            except (AttributeError, ValueError) as exc:
+                self.send_body(412, dumps({"errors": [{"error": str(exc)}]}), headers)
+                return
+            limit = min(int(query.get("limit", 1000)), 1000)
+            offset = int(query.get("offset", 0))
+            first, last = min(start + offset, stop), min(start + offset + limit, stop)
+            body = dumps({
+                "context": {"employee": {"meta": {"href": "https://api.moysklad.ru/api/remap/1.2/context/employee"}}},
+                "meta": {"href": f"https://api.moysklad.ru/api/remap/1.2/entity/{order_type}", "type": order_type,
+                         "mediaType": "application/json", "size": stop - start, "limit": limit, "offset": offset},
+                "rows": list(orders.rows(first, last))
+            })
+
+            headers.append(("Content-Type", "application/json;charset=utf-8"))
+            if "gzip" in self.headers.get("Accept-Encoding", ""):
+                body = gzip.compress(body, compresslevel=1)
+                headers.append(("Content-Encoding", "gzip"))
+            self.send_body(200, body, headers)
+
+    return Handler
+
+
+def serve(rows, seed, latency, rate, burst, port, ready=None):
+    dataset = synthetic_dataset(rows, seed)
+    bucket = TokenBucket(rate, burst) if rate else None
+    counters = {"requests": 0, "throttled": 0, "lock": threading.Lock()}
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(dataset, latency, bucket, counters))
+    if ready is not None:
+        ready.put(server.server_port)
+    server.serve_forever()
+
+
+# Заглушка /entity/cashin и /entity/cashout на синтетическом наборе в
+# отдельном процессе, чтобы её работа не делила GIL с замеряемым клиентом.
+# latency — задержка каждого ответа в секундах, rate и burst — лимит запросов
+class MoySkladStub:
+    def __init__(self, rows, seed=1, latency=0.0, rate=None, burst=45, port=0):
+        self.args = (rows, seed, latency, rate, burst, port)
+        self.process = None
+        self.base_url = None
+
+    def start(self):
+        context = multiprocessing.get_context("spawn")
+        ready = context.Queue()
+        self.process = context.Process(target=serve, args=(*self.args, ready), daemon=True)
+        self.process.start()
+        self.base_url = f"http://127.0.0.1:{ready.get(timeout=600)}/entity"
+        return self
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+            self.process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная заглушка API МоегоСклада на синтетических данных")
+    parser.add_argument("--rows", type=int, default=100_000, help="документов cashin и cashout вместе")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, секунды")
+    parser.add_argument("--rate", type=float, default=None, help="запросов в секунду, по умолчанию без лимита")
+    parser.add_argument("--burst", type=int, default=45)
+    parser.add_argument("--port", type=int, default=8081)
+    args = parser.parse_args()
+    print(f"http://127.0.0.1:{args.port}/entity")
+    serve(args.rows, args.seed, args.latency, args.rate, args.burst, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import hashlib
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from functools import cached_property
+from heapq import merge
+from operator import attrgetter
+
+from aggregate import DailyRollup
+from moysklad import CASH_ORDER_TYPES
+from records import CashOrder
+
+# Формат moment в МоёмСкладе: "YYYY-MM-DD HH:MM:SS" и, возможно, ".fff".
+# Такие строки сравниваются лексикографически так же, как даты
+FIXED_WIDTH_MOMENT = re.compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(\.\d{1,6})?$")
+
+
+# Все поля ордера: у CashOrder нет id, одинаковые по полям ордера взаимозаменяемы
+order_fields = attrgetter(*CashOrder.__slots__)
+
+
+def parse_moment(value):
+    return datetime.fromisoformat(value.replace("Z", ""))
+
+
+# Хэш содержимого ордеров: меняется при любом изменении, добавлении
+# или удалении ордера из списка
+def orders_digest(orders):
+    content = "".join([
+        f"{order.moment}\x1f{order.name}\x1f{order.amount}\x1f{order.currency}\x1f{order.payment_type}"
+        f"\x1f{order.test_order:d}\x1f{order.doc_type}\x1f{order.comment}\x1e"
+        for order in orders
+    ])
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+
+# Ключ начала месяца: строка "YYYY-MM" меньше любого moment этого месяца
+def month_start_key(year, month, lexicographic):
+    year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+    return f"{year:04d}-{month:02d}" if lexicographic else datetime(year, month, 1)
+
+
+# Ордера обоих типов в одном списке, отсортированном по moment.
+# Выборка за период — два bisect и срез, без разбора дат по каждой строке.
+# Веб-хуки меняют индекс на месте под lock; читатели берут тот же lock.
+# revision — версия хранилища, которой соответствуют данные индекса
+class OrderIndex:
+    def __init__(self, orders):
+        self.orders = list(orders)
+        moments = [order.moment for order in self.orders]
+        # Быстрый путь: ключи — сами строки moment. Если хоть одна строка
+        # в другом формате, индексируем разобранные даты
+        self.lexicographic = all(FIXED_WIDTH_MOMENT.match(moment) for moment in moments)
+        if self.lexicographic:
+            # Вход обычно уже отсортирован (from_store), и тогда сортировка линейна
+            self.orders.sort(key=attrgetter("moment"))
+            self.keys = [order.moment for order in self.orders]
+        else:
+            self.keys = [parse_moment(moment) for moment in moments]
+            order = sorted(range(len(self.keys)), key=self.keys.__getitem__)
+            self.keys = [self.keys[i] for i in order]
+            self.orders = [self.orders[i] for i in order]
+        self._digests = {}
+        self.revision = None
+        self.lock = threading.RLock()
+
+    @classmethod
+    def from_store(cls, store, order_types=CASH_ORDER_TYPES):
+        return cls(merge(*(store.iter_all_orders(order_type) for order_type in order_types), key=attrgetter("moment")))
+
+    def __len__(self):
+        return len(self.orders)
+
+    # Позиции [first, last) ордеров с start_date <= moment <= end_date
+    def bounds(self, start_date, end_date):
+        if self.lexicographic:
+            lower = f"{start_date:%Y-%m-%d %H:%M:%S}"
+            upper = f"{end_date:%Y-%m-%d %H:%M:%S.%f}"
+        else:
+            lower, upper = start_date, end_date
+        first = bisect_left(self.keys, lower)
+        return first, max(first, bisect_right(self.keys, upper))
+
+    def select(self, start_date, end_date):
+        first, last = self.bounds(start_date, end_date)
+        return self.orders[first:last]
+
+    # Позиции [first, last), разбитые по календарным месяцам: (месяц "YYYY-MM", начало, конец)
+    def month_bounds(self, first, last):
+        months = []
+        while first < last:
+            month = self._month(self.keys[first])
+            year, number = int(month[:4]), int(month[5:])
+            stop = bisect_left(self.keys, month_start_key(year, number + 1, self.lexicographic), first, last)
+            months.append((month, first, stop))
+            first = stop
+        return months
+
+    def _key(self, moment):
+        return moment if self.lexicographic else parse_moment(moment)
+
+    def _month(self, key):
+        return key[:7] if self.lexicographic else f"{key:%Y-%m}"
+
+    # Хэш ордеров [first, last). Запоминаются только хэши целых календарных
+    # месяцев, по месяцу: прошлые месяцы хэшируются при первом отчёте после
+    # пересборки индекса, а запомненных хэшей не больше, чем месяцев в данных.
+    # Неполные месяцы на краях периода хэшируются каждый раз;
+    # apply_changes сбрасывает хэши месяцев, которые задело
+    def digest(self, first, last):
+        if first == last:
+            return orders_digest(())
+        month = self._month(self.keys[first])
+        year, number = int(month[:4]), int(month[5:])
+        whole = (
+            first == bisect_left(self.keys, month_start_key(year, number, self.lexicographic))
+            and last == bisect_left(self.keys, month_start_key(year, number + 1, self.lexicographic))
+        )
+        if not whole:
+            return orders_digest(self.orders[first:last])
+        value = self._digests.get(month)
+        if value is None:
+            value = self._digests[month] = orders_digest(self.orders[first:last])
+        return value
+
+    # Изменения из веб-хуков на месте: прежние версии и удалённые ордера
+    # убираются, новые вставляются по moment, итоги по дням сдвигаются.
+    # False — изменение нельзя применить на месте (ордера нет в индексе
+    # или moment в другом формате), индекс нужно пересобрать
+    def apply_changes(self, removed, added):
+        with self.lock:
+            if self.lexicographic and not all(FIXED_WIDTH_MOMENT.match(order.moment) for order in added):
+                return False
+            positions = set()
+            for order in removed:
+                key, fields = self._key(order.moment), order_fields(order)
+                position = bisect_left(self.keys, key)
+                while position < len(self.keys) and self.keys[position] == key and (
+                    position in positions or order_fields(self.orders[position]) != fields
+                ):
+                    position += 1
+                if position == len(self.keys) or self.keys[position] != key:
+                    return False
+                positions.add(position)
+            for position in sorted(positions, reverse=True):
+                del self.keys[position]
+                del self.orders[position]
+            for order in added:
+                key = self._key(order.moment)
+                position = bisect_right(self.keys, key)
+                self.keys.insert(position, key)
+                self.orders.insert(position, order)
+
+            if "rollup" in self.__dict__:
+                self.rollup.apply(removed, added)
+            for order in (*removed, *added):
+                self._digests.pop(self._month(self._key(order.moment)), None)
+            return True
+
+    # Итоги по дням строятся один раз на индекс, при первом обращении
+    @cached_property
+    def rollup(self):
+        with self.lock:
+            return DailyRollup(self.orders)
+
+
+# Индекс текущей версии хранилища. Изменения из веб-хуков применяются к нему
+# на месте вместе с версией хранилища до и после них; любое другое изменение
+# хранилища (синхронизация, другой процесс) пересобирает индекс целиком
+class LiveIndex:
+    def __init__(self, store):
+        self.store = store
+        self.index = None
+        self.revision = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        with self._lock:
+            revision = self.store.revision()
+            if self.index is None or revision != self.revision:
+                self.index = OrderIndex.from_store(self.store)
+                self.index.revision = self.revision = revision
+            return self.index
+
+    def apply(self, removed, added, before, after):
+        with self._lock:
+            if self.index is None or self.revision != before:
+                return
+            # Версия меняется под lock индекса вместе с данными: читатель,
+            # держащий lock, видит согласованные данные и версию
+            with self.index.lock:
+                if self.index.apply_changes(removed, added):
+                    self.index.revision = self.revision = after
@@ -0,0 +1,223 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from moysklad import CASH_ORDER_TYPES, PAGE_LIMIT, build_range_filter
+from records import DOC_TYPES, CashOrder, parse_order
+
+# Хранилище — это кэш: при смене схемы оно пересоздаётся и заполняется заново
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id TEXT PRIMARY KEY,
+    entity TEXT NOT NULL,
+    moment TEXT NOT NULL,
+    updated TEXT NOT NULL,
+    name TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    currency TEXT,
+    payment_type TEXT,
+    test_order INTEGER NOT NULL,
+    comment TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_entity_moment ON orders (entity, moment);
+CREATE TABLE IF NOT EXISTS sync_state (
+    entity TEXT PRIMARY KEY,
+    watermark TEXT NOT NULL
+);
+"""
+
+
+# Строка sync_state с последним updated из веб-хуков: версия хранилища
+# берёт максимум по всем отметкам, поэтому меняется и от веб-хуков,
+# а отметки синхронизации по типам документов остаются прежними
+WEBHOOK_STATE = "webhook"
+
+
+# Период сверки с сервером. Пропущенные строки могут оказаться и раньше
+# первого, и позже последнего локального документа, поэтому сверяется весь
+# диапазон; совпавшие половины стоят одного запроса количества
+RECONCILE_SPAN = (datetime(2000, 1, 1), datetime(2100, 1, 1))
+
+
+# Локальное хранилище кассовых ордеров с инкрементальной синхронизацией
+class OrderStore:
+    def __init__(self, path):
+        self.path = path
+        self._sync_lock = threading.Lock()
+        self._synced_at = None
+        with self._connect() as conn:
+            (version,) = conn.execute("PRAGMA user_version").fetchone()
+            if version != SCHEMA_VERSION:
+                conn.executescript("DROP TABLE IF EXISTS orders; DROP TABLE IF EXISTS sync_state;")
+            conn.executescript(SCHEMA)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def watermarks(self):
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT entity, watermark FROM sync_state"))
+
+    # Следующая синхронизация пойдёт к API, даже если данные ещё считаются
+    # свежими — например, когда изменения из веб-хуков не удалось применить
+    def invalidate(self):
+        self._synced_at = None
+
+    # max_age — сколько секунд после прошлой синхронизации данные считаются
+    # свежими; в этом случае к API не обращаемся вовсе.
+    # progress передаётся в client.iter_pages. Возвращает число полученных документов
+    def sync(self, client, order_types=CASH_ORDER_TYPES, max_age=0, progress=None):
+        with self._sync_lock:
+            if self._synced_at is not None and time.monotonic() - self._synced_at < max_age:
+                return 0
+            watermarks = self.watermarks()
+            queries = {}
+            for order_type in order_types:
+                watermark = watermarks.get(order_type)
+                # Первая загрузка берёт только проведённые документы, дальше — всё,
+                # что изменилось после водяной отметки, включая распроведённые.
+                # Отметка обрезается до секунд, повторно пришедшие строки просто перезапишутся
+                if watermark:
+                    queries[order_type] = f"updated>={watermark[:19]}"
+                else:
+                    queries[order_type] = "applicable=true"
+
+            # Страницы записываются по мере поступления; отметка сдвигается
+            # только после того, как пришли все страницы
+            received = 0
+            with self._connect() as conn:
+                for order_type, _, rows in client.iter_pages(queries, progress):
+                    received += len(rows)
+                    watermark = self._apply(conn, rows, order_type)
+                    if watermark is not None and (watermarks.get(order_type) or "") < watermark:
+                        watermarks[order_type] = watermark
+                conn.executemany(
+                    "INSERT OR REPLACE INTO sync_state (entity, watermark) VALUES (?, ?)",
+                    [(order_type, watermarks[order_type]) for order_type in order_types if watermarks.get(order_type)]
+                )
+
+            for order_type in order_types:
+                self._reconcile(client, order_type)
+            self._synced_at = time.monotonic()
+            return received
+
+    # Возвращает максимальный updated среди строк страницы
+    def _apply(self, conn, rows, order_type):
+        watermark = None
+        for row in rows:
+            if row.get('applicable', False):
+                # Храним только поля, которые нужны отчётам
+                order = parse_order(row, order_type)
+                conn.execute(
+                    "INSERT OR REPLACE INTO orders "
+                    "(id, entity, moment, updated, name, amount, currency, payment_type, test_order, comment) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (row['id'], order_type, order.moment, row['updated'], order.name, order.amount,
+                     order.currency, order.payment_type, order.test_order, order.comment)
+                )
+            else:
+                conn.execute("DELETE FROM orders WHERE id = ?", (row['id'],))
+            if watermark is None or row['updated'] > watermark:
+                watermark = row['updated']
+        return watermark
+
+    # Изменения из веб-хуков: rows — облегчённые документы после CREATE/UPDATE
+    # (распроведённые удаляются), deleted — id удалённых документов.
+    # Возвращает (прежние версии ордеров, новые ордера, версия до, версия после):
+    # по ним индекс в памяти обновляется на месте
+    def apply_changes(self, order_type, rows=(), deleted=()):
+        doc_type = DOC_TYPES[order_type]
+        with self._sync_lock:
+            before = self.revision()
+            removed = []
+            with self._connect() as conn:
+                for order_id in {*deleted, *(row['id'] for row in rows)}:
+                    old = conn.execute(
+                        "SELECT moment, name, amount, currency, payment_type, test_order, comment FROM orders WHERE id = ?",
+                        (order_id,)
+                    ).fetchone()
+                    if old is not None:
+                        moment, name, amount, currency, payment_type, test_order, comment = old
+                        removed.append(CashOrder(moment, name, amount, currency, payment_type, bool(test_order), doc_type, comment))
+                conn.executemany("DELETE FROM orders WHERE id = ?", [(order_id,) for order_id in deleted])
+                watermark = self._apply(conn, rows, order_type)
+                if watermark is not None:
+                    conn.execute(
+                        "INSERT INTO sync_state (entity, watermark) VALUES (?, ?) "
+                        "ON CONFLICT (entity) DO UPDATE SET watermark = MAX(watermark, excluded.watermark)",
+                        (WEBHOOK_STATE, watermark)
+                    )
+            added = [parse_order(row, order_type) for row in rows if row.get('applicable', False)]
+            return removed, added, before, self.revision()
+
+    # Удалённые документы не приходят по фильтру updated, а при первой загрузке
+    # страницы по offset могут пропустить строки, если данные меняются во время
+    # синхронизации. Поэтому сверяем количество документов с сервером и сужаем
+    # расхождение делением периода
+    def _reconcile(self, client, order_type):
+        self._reconcile_range(client, order_type, *RECONCILE_SPAN)
+
+    def _reconcile_range(self, client, order_type, lower, upper):
+        filters = build_range_filter(lower, upper)
+        lower_key, upper_key = f"{lower:%Y-%m-%d %H:%M:%S}", f"{upper:%Y-%m-%d %H:%M:%S}"
+        with self._connect() as conn:
+            (local,) = conn.execute(
+                "SELECT COUNT(*) FROM orders WHERE entity = ? AND moment >= ? AND moment < ?",
+                (order_type, lower_key, upper_key)
+            ).fetchone()
+        # Лишние локальные документы — удаления, недостающие — пропущенные
+        # при загрузке. Равные количества считаем совпадением
+        server = client.count(order_type, filters)
+        if local == server:
+            return
+
+        if server <= PAGE_LIMIT or upper - lower <= timedelta(seconds=1):
+            rows = client.fetch_many({order_type: filters})[order_type]
+            alive = {row['id'] for row in rows}
+            with self._connect() as conn:
+                ids = [
+                    order_id for (order_id,) in conn.execute(
+                        "SELECT id FROM orders WHERE entity = ? AND moment >= ? AND moment < ?",
+                        (order_type, lower_key, upper_key)
+                    )
+                    if order_id not in alive
+                ]
+                conn.executemany("DELETE FROM orders WHERE id = ?", [(order_id,) for order_id in ids])
+                # Строки сервера записываются заново: так появляются пропущенные.
+                # Отметку не двигаем — она относится к загрузке по updated
+                self._apply(conn, rows, order_type)
+            return
+
+        middle = (lower + (upper - lower) / 2).replace(microsecond=0)
+        self._reconcile_range(client, order_type, lower, middle)
+        self._reconcile_range(client, order_type, middle, upper)
+
+    # Версия данных: меняется при любой вставке, изменении или удалении
+    def revision(self):
+        with self._connect() as conn:
+            (watermark,) = conn.execute("SELECT MAX(watermark) FROM sync_state").fetchone()
+            (count,) = conn.execute("SELECT COUNT(*) FROM orders").fetchone()
+        return f"{watermark}:{count}"
+
+    # Все ордера типа по возрастанию moment, по одному, без загрузки всей выборки
+    def iter_all_orders(self, order_type):
+        doc_type = DOC_TYPES[order_type]
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT moment, name, amount, currency, payment_type, test_order, comment FROM orders "
+                "WHERE entity = ? ORDER BY moment",
+                (order_type,)
+            )
+            for moment, name, amount, currency, payment_type, test_order, comment in rows:
+                yield CashOrder(moment, name, amount, currency, payment_type, bool(test_order), doc_type, comment)
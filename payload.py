@@ -0,0 +1,46 @@
+# orjson разбирает ответ быстрее; без него — стандартный json
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+from records import currency_from_href
+
+
+# Плоский облегчённый документ: только поля, которые читают parse_order
+# и хранилище. meta, organization, agent, rate целиком и остальные
+# реквизиты отбрасываются сразу после разбора страницы
+def slim_row(row):
+    payment_type = None
+    test_order = False
+    for attr in row.get("attributes", ()):
+        name = attr["name"]
+        if name == "PaymentType":
+            value = attr.get("value")
+            payment_type = value["name"] if value else None
+        elif name == "test_order":
+            test_order = bool(attr.get("value", False))
+    return {
+        "id": row["id"],
+        "name": row["name"],
+        "moment": row["moment"],
+        "updated": row["updated"],
+        "applicable": row.get("applicable", False),
+        "sum": row["sum"],
+        "description": row.get("description", ""),
+        "currency": currency_from_href(row["rate"]["currency"]["meta"]["href"]),
+        "payment_type": payment_type,
+        "test_order": test_order
+    }
+
+
+# Страница списка: meta.size и облегчённые строки. Полный разобранный
+# ответ живёт только до конца вызова
+def decode_page(content):
+    data = loads(content)
+    return {"meta": {"size": data["meta"]["size"]}, "rows": [slim_row(row) for row in data.get("rows", ())]}
+
+
+# Один документ, например по ссылке из веб-хука
+def decode_document(content):
+    return slim_row(loads(content))
@@ -0,0 +1,155 @@
+import random
+import threading
+import time
+
+import requests
+
+# Коды ответа, после которых запрос имеет смысл повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def header_seconds(response, name, scale=1000):
+    # Интервалы в заголовках МоегоСклада приходят в миллисекундах
+    value = response.headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value) / scale
+    except ValueError:
+        return None
+
+
+# Планировщик запросов: держит число одновременных запросов в пределах лимита
+# аккаунта, подстраивает его по заголовкам X-RateLimit-* / X-Lognex-* и
+# повторяет 429/5xx с экспоненциальной задержкой и джиттером
+class RequestScheduler:
+    def __init__(self, max_concurrency, max_retries=6, base_delay=0.5, max_delay=30.0):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._cond = threading.Condition()
+        self._window = max_concurrency
+        self._in_flight = 0
+        self._resume_at = 0.0
+        self._interval = 0.0
+        self._last_start = 0.0
+        self._successes = 0
+
+        self._started = None
+        self._counters = {'requests': 0, 'retries': 0, 'throttled': 0, 'server_errors': 0, 'waits': 0.0}
+
+    def _acquire(self):
+        with self._cond:
+            if self._started is None:
+                self._started = time.monotonic()
+            waited_from = time.monotonic()
+            while True:
+                # Когда лимит почти исчерпан, запросы стартуют не чаще, чем он восстанавливается
+                pause = max(self._resume_at, self._last_start + self._interval) - time.monotonic()
+                if pause > 0:
+                    self._cond.wait(pause)
+                elif self._in_flight >= self._window:
+                    self._cond.wait()
+                else:
+                    break
+            self._last_start = time.monotonic()
+            self._counters['waits'] += self._last_start - waited_from
+            self._in_flight += 1
+            self._counters['requests'] += 1
+
+    def _release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def _pause(self, seconds):
+        with self._cond:
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+    def _observe(self, response):
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        reset = header_seconds(response, 'X-Lognex-Reset')
+        with self._cond:
+            self._successes += 1
+            # Аддитивное увеличение окна, пока лимит не близок к исчерпанию
+            if self._successes >= self._window and self._window < self.max_concurrency:
+                self._window += 1
+                self._successes = 0
+                self._cond.notify_all()
+        if remaining is None or reset is None:
+            return
+        remaining = int(remaining)
+        limit = int(response.headers.get('X-RateLimit-Limit', 0))
+        with self._cond:
+            if remaining >= self._window or limit <= remaining:
+                self._interval = 0.0
+            else:
+                # Остатка не хватит на следующую волну запросов — переходим на
+                # темп восстановления лимита (reset — время до полного сброса)
+                self._interval = reset / (limit - remaining)
+
+    def _throttle(self):
+        # Мультипликативное уменьшение окна после отказа по лимиту
+        with self._cond:
+            self._window = max(1, self._window // 2)
+            self._successes = 0
+            self._counters['throttled'] += 1
+
+    def _backoff(self, response, attempt):
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        if response is not None:
+            retry_after = header_seconds(response, 'X-Lognex-Retry-After')
+            if retry_after is None:
+                retry_after = header_seconds(response, 'Retry-After', scale=1)
+            if retry_after is not None:
+                return retry_after + random.uniform(0, self.base_delay)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def send(self, do_request):
+        attempt = 0
+        while True:
+            self._acquire()
+            try:
+                response = do_request()
+                error = None
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                response, error = None, exc
+            finally:
+                self._release()
+
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                if response.ok:
+                    self._observe(response)
+                return response
+
+            if attempt >= self.max_retries:
+                if error is not None:
+                    raise error
+                return response
+
+            if response is not None and response.status_code == 429:
+                self._throttle()
+            else:
+                with self._cond:
+                    self._counters['server_errors'] += 1
+            delay = self._backoff(response, attempt)
+            if response is not None and response.status_code == 429:
+                # Отказ по лимиту касается всего аккаунта, поэтому ждут все потоки
+                self._pause(delay)
+            else:
+                time.sleep(delay)
+            with self._cond:
+                self._counters['retries'] += 1
+            attempt += 1
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._counters)
+            elapsed = time.monotonic() - self._started if self._started is not None else 0.0
+            stats['window'] = self._window
+            stats['elapsed'] = round(elapsed, 3)
+            stats['waits'] = round(stats['waits'], 3)
+            stats['requests_per_second'] = round(stats['requests'] / elapsed, 2) if elapsed else 0.0
+        return stats
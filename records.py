@@ -0,0 +1,55 @@
+INCOME = "Приход"
+EXPENSE = "Расход"
+
+# Тип документа МоегоСклада -> направление движения денег
+DOC_TYPES = {
+    "cashin": INCOME,
+    "cashout": EXPENSE
+}
+
+CURRENCIES = ("PLN", "USD", "EUR")
+
+# UUID валюты из meta.href -> код валюты
+CURRENCY_BY_ID = {
+    "e03f64a6-2225-11ed-0a80-073a00365127": "PLN",
+    "e15d9c47-2226-11ed-0a80-04b900364797": "USD",
+    "e1754d40-cc82-11ec-0a80-08ab00701a1e": "EUR"
+}
+
+
+def currency_from_href(currency_href):
+    return CURRENCY_BY_ID.get(currency_href[currency_href.rfind("/") + 1:])
+
+
+# Кассовый ордер с полями, нужными отчётам. Сумма в копейках со знаком:
+# расход отрицательный. Валюта None, если она не из CURRENCIES
+class CashOrder:
+    __slots__ = ("moment", "name", "amount", "currency", "payment_type", "test_order", "doc_type", "comment")
+
+    def __init__(self, moment, name, amount, currency, payment_type, test_order, doc_type, comment):
+        self.moment = moment
+        self.name = name
+        self.amount = amount
+        self.currency = currency
+        self.payment_type = payment_type
+        self.test_order = test_order
+        self.doc_type = doc_type
+        self.comment = comment
+
+    def __repr__(self):
+        return f"CashOrder({self.moment!r}, {self.name!r}, {self.amount!r}, {self.currency!r})"
+
+
+# Ордер из облегчённого документа (payload.slim_row)
+def parse_order(row, order_type):
+    doc_type = DOC_TYPES[order_type]
+    return CashOrder(
+        row["moment"],
+        row["name"],
+        row["sum"] if doc_type == INCOME else -row["sum"],
+        row["currency"],
+        row["payment_type"],
+        row["test_order"],
+        doc_type,
+        row["description"]
+    )
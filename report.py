@@ -0,0 +1,198 @@
+from io import BytesIO
+from itertools import islice
+
+from aggregate import OrderColumns, Totals, as_money, combine_totals
+from xlsx_render import NEGATIVE_BALANCE, PLN_TOTAL, PLN_TOTAL_NEGATIVE, XlsxRenderer
+
+# Сколько ордеров обрабатывается за один векторный проход
+CHUNK_SIZE = 10_000
+
+BALANCE_SUMMARY_HEADER = ["Валюта", "Наличные", "Карта", "Количество документов"]
+LEDGER_SUMMARY_HEADER = ["Валюта", "Наличные", "Карта", "Количество документов", "Тестовые ордера"]
+
+# Сводка по нескольким аккаунтам: колонка аккаунта перед колонками сводки
+CONSOLIDATED_TITLE = "Сводка по аккаунтам"
+ACCOUNT_COLUMN = "Аккаунт"
+COMBINED_ACCOUNT = "Итого"
+
+# Типы платежа, которые попадают в детали отчёта «Баланс по валютам»
+LEDGER_PAYMENT_TYPES = {
+    "Card-in-showroom": "card",
+    "Cash-in-showroom": "cash"
+}
+
+
+# progress(обработано строк) вызывается перед каждой следующей пачкой
+def iter_chunks(orders, size=CHUNK_SIZE, progress=None):
+    orders = iter(orders)
+    processed = 0
+    while True:
+        chunk = list(islice(orders, size))
+        if not chunk:
+            break
+        yield chunk
+        processed += len(chunk)
+        if progress is not None:
+            progress(processed)
+
+
+# prefix — ячейки перед колонками сводки (например, имя аккаунта)
+def append_balance_summary(sheet, totals, prefix=()):
+    for currency, cash, card, count in totals.balance_summary():
+        sheet.append([*prefix, currency, as_money(cash), as_money(card), count])
+
+
+def append_ledger_summary(renderer, sheet, totals, prefix=()):
+    for currency, cash, card, count, test_count in totals.ledger_summary():
+        row = [*prefix, currency, as_money(cash), as_money(card), count, test_count]
+        # Проверка отрицательных значений и установка стиля
+        if cash < 0 or card < 0:
+            row = [renderer.styled_cell(sheet, NEGATIVE_BALANCE, value) for value in row]
+        sheet.append(row)
+
+
+# Листы (сводка, детали) отчёта «Остатки по валютам»
+def create_balance_sheets(renderer):
+    summary_sheet = renderer.create_sheet(
+        "Остатки по валютам", BALANCE_SUMMARY_HEADER
+    )
+    details_sheet = renderer.create_sheet(
+        "Детали ордеров",
+        ["Дата", "Номер ордера", "Cash, PLN", "PLN total", "Cash, USD", "Cash, EUR", "Card", "Currency", "Comment"],
+        widths={'A': 15}
+    )
+    return summary_sheet, details_sheet
+
+
+# Листы (сводка, детали) отчёта «Баланс по валютам»
+def create_ledger_sheets(renderer):
+    summary_sheet = renderer.create_sheet(
+        "Баланс по валютам", LEDGER_SUMMARY_HEADER
+    )
+    details_sheet = renderer.create_sheet(
+        "Детали ордеров", ["Дата", "Номер ордера", "Сумма", "Валюта", "Тип платежа", "Тип документа", "Test Order", "Комментарий"]
+    )
+    return summary_sheet, details_sheet
+
+
+# Отчёт «Остатки по валютам» с нарастающим итогом PLN (testy.py).
+# Ордера идут пачками: итоги и остаток PLN считаются по пачке целиком
+# в копейках, строки пишутся в лист сразу
+def write_balance_report(orders, output, opening_pln_balance=0, progress=None):
+    renderer = XlsxRenderer()
+    summary_sheet, details_sheet = create_balance_sheets(renderer)
+    total_cell = renderer.styled_cell(details_sheet, PLN_TOTAL)
+    negative_total_cell = renderer.styled_cell(details_sheet, PLN_TOTAL_NEGATIVE)
+
+    # Нарастающий итог PLN начинается с остатка наличных на начало периода
+    totals = Totals(opening_pln_balance)
+    for chunk in iter_chunks(orders, progress=progress):
+        running = totals.add(OrderColumns(chunk)).tolist()
+        for order, pln_total in zip(chunk, running):
+            currency = order.currency
+            if not currency:
+                continue
+            sum_value = as_money(order.amount)
+            payment_type = order.payment_type
+            is_cash = payment_type == "Cash-in-showroom"
+
+            pln_total_cell = negative_total_cell if pln_total < 0 else total_cell
+            pln_total_cell.value = as_money(pln_total)
+
+            # Пустые колонки передаются как None: такие ячейки не пишутся в файл вовсе
+            details_sheet.append([
+                order.moment.split(' ')[0],
+                order.name,
+                sum_value if is_cash and currency == "PLN" else 0,
+                pln_total_cell,
+                sum_value if is_cash and currency == "USD" else None,
+                sum_value if is_cash and currency == "EUR" else None,
+                sum_value if payment_type == "Card-in-showroom" else None,
+                currency,
+                order.comment
+            ])
+
+    append_balance_summary(summary_sheet, totals)
+    return renderer.save(output)
+
+
+# Отчёт «Баланс по валютам» с тестовыми ордерами (app6.py)
+def write_ledger_report(orders, output, progress=None):
+    renderer = XlsxRenderer()
+    ws1, ws2 = create_ledger_sheets(renderer)
+
+    totals = Totals()
+    for chunk in iter_chunks(orders, progress=progress):
+        totals.add(OrderColumns(chunk))
+        for order in chunk:
+            currency = order.currency
+            payment_type = LEDGER_PAYMENT_TYPES.get(order.payment_type)
+            # Пропускаем записи с неизвестным payment_type
+            if not payment_type or not currency:
+                continue
+            ws2.append([
+                order.moment.split(" ")[0], order.name, as_money(order.amount),
+                currency, payment_type, order.doc_type,
+                "yes" if order.test_order else "no", order.comment
+            ])
+
+    append_ledger_summary(renderer, ws1, totals)
+    return renderer.save(output)
+
+
+def build_balance_report(orders, opening_pln_balance=0, progress=None):
+    output = write_balance_report(orders, BytesIO(), opening_pln_balance, progress)
+    output.seek(0)
+    return output
+
+
+def build_ledger_report(orders, progress=None):
+    output = write_ledger_report(orders, BytesIO(), progress)
+    output.seek(0)
+    return output
+
+
+# Только сводные листы по готовым итогам периода (например, из DailyRollup)
+def build_balance_summary(totals):
+    renderer = XlsxRenderer()
+    sheet = renderer.create_sheet("Остатки по валютам", BALANCE_SUMMARY_HEADER)
+    append_balance_summary(sheet, totals)
+    output = renderer.save(BytesIO())
+    output.seek(0)
+    return output
+
+
+def build_ledger_summary(totals):
+    renderer = XlsxRenderer()
+    sheet = renderer.create_sheet("Баланс по валютам", LEDGER_SUMMARY_HEADER)
+    append_ledger_summary(renderer, sheet, totals)
+    output = renderer.save(BytesIO())
+    output.seek(0)
+    return output
+
+
+# Итоги каждого аккаунта и строка «Итого» по всем аккаунтам вместе
+def with_combined(account_totals):
+    return [*account_totals, (COMBINED_ACCOUNT, combine_totals(totals for _, totals in account_totals))]
+
+
+# Один сводный лист по нескольким аккаунтам: сначала строки каждого
+# аккаунта, затем итог. account_totals — [(имя аккаунта, Totals)]
+def build_consolidated_balance_summary(account_totals):
+    renderer = XlsxRenderer()
+    sheet = renderer.create_sheet(CONSOLIDATED_TITLE, [ACCOUNT_COLUMN, *BALANCE_SUMMARY_HEADER])
+    for name, totals in with_combined(account_totals):
+        append_balance_summary(sheet, totals, (name,))
+    output = renderer.save(BytesIO())
+    output.seek(0)
+    return output
+
+
+def build_consolidated_ledger_summary(account_totals):
+    renderer = XlsxRenderer()
+    sheet = renderer.create_sheet(CONSOLIDATED_TITLE, [ACCOUNT_COLUMN, *LEDGER_SUMMARY_HEADER])
+    for name, totals in with_combined(account_totals):
+        append_ledger_summary(renderer, sheet, totals, (name,))
+    output = renderer.save(BytesIO())
+    output.seek(0)
+    return output
@@ -0,0 +1,213 @@
+import streamlit as st
+from datetime import datetime, date
+
+# Здесь только то, что нужно для первой отрисовки. Клиент API (requests),
+# индекс (numpy) и формирование файлов (openpyxl, pyarrow) импортируются
+# при первом использовании внутри функций ниже — в фоновом задании отчёта
+# или в ресурсах cache_resource — и дальше остаются загруженными в процессе
+from report_cache import ReportCache
+from metrics import enable_logging
+from report_jobs import ReportJobs
+
+DESCRIPTION = """
+Программа для сбора финансовых данных и экспорта их в Excel.
+Нажмите кнопку ниже, чтобы сгенерировать отчёт.
+"""
+
+# Клиент с пулом соединений живёт между перезапусками скрипта.
+# Учетные данные берутся из Streamlit Secrets
+@st.cache_resource
+def get_client():
+    from moysklad import MoySkladClient, DEFAULT_CONCURRENCY
+    return MoySkladClient(
+        st.secrets["username"], st.secrets["password"], concurrency=st.secrets.get("concurrency", DEFAULT_CONCURRENCY)
+    )
+
+# Локальная копия ордеров, между запусками докачиваются только изменения
+@st.cache_resource
+def get_store():
+    from order_store import OrderStore
+    return OrderStore(st.secrets.get("store_path", "orders.sqlite3"))
+
+# Отсортированный по moment индекс ордеров в памяти; пересобирается только
+# при изменении данных, смена дат отчёта — это лишь срез индекса.
+# Изменения из веб-хуков применяются к нему на месте
+@st.cache_resource
+def get_live_index():
+    from order_index import LiveIndex
+    return LiveIndex(get_store())
+
+# Готовые отчёты по периоду и версии данных: повторное скачивание не трогает API
+@st.cache_resource
+def get_report_cache():
+    return ReportCache(
+        max_entries=st.secrets.get("report_cache_entries", 32),
+        max_bytes=st.secrets.get("report_cache_mb", 256) * 2**20,
+        ttl=st.secrets.get("report_cache_ttl", 600)
+    )
+
+# Готовые строки деталей по месяцам: прошлые месяцы не меняются, поэтому
+# живут долго и переиспользуются отчётами за любые периоды и версии данных
+@st.cache_resource
+def get_fragment_cache():
+    return ReportCache(
+        max_entries=st.secrets.get("fragment_cache_entries", 1024),
+        max_bytes=st.secrets.get("fragment_cache_mb", 256) * 2**20,
+        ttl=st.secrets.get("fragment_cache_ttl", 7 * 86400)
+    )
+
+# Фоновые задания переживают перезапуски скрипта и общие для всех сессий
+@st.cache_resource
+def get_jobs():
+    return ReportJobs(max_workers=st.secrets.get("report_workers", 2))
+
+# Аккаунты шоурумов для сводного отчёта: в secrets массив [[accounts]]
+# с name, username, password и необязательными store_path и concurrency.
+# У каждого аккаунта свой клиент с пулом соединений и лимитом запросов
+@st.cache_resource
+def get_accounts():
+    from consolidation import Account, AccountGroup
+    accounts = [Account(**entry) for entry in st.secrets.get("accounts", [])]
+    return AccountGroup(accounts) if accounts else None
+
+# Приёмник веб-хуков МоегоСклада, если задан webhook_port: изменения ордеров
+# попадают в хранилище и индекс сразу, и отчёту не нужна синхронизация.
+# Адрес для МоегоСклада — http://<хост>:<webhook_port>/?token=<webhook_token>;
+# без webhook_token приёмник не запускается, а страница предупреждает об этом
+# (см. run). По умолчанию слушает только 127.0.0.1 — наружу его открывает
+# обратный прокси или webhook_host
+@st.cache_resource
+def get_receiver():
+    port = st.secrets.get("webhook_port")
+    if port is None or not st.secrets.get("webhook_token"):
+        return None
+    from webhooks import WebhookReceiver
+    receiver = WebhookReceiver(
+        get_store(), get_client(), get_live_index(),
+        token=st.secrets.get("webhook_token"), record_path=st.secrets.get("webhook_record_path")
+    )
+    return receiver.serve(st.secrets.get("webhook_host", "127.0.0.1"), port)
+
+# Задания выполняются в фоновом потоке; модули отчётов загружаются там же
+# при первом отчёте. Ресурсы передаются готовыми, см. report_core.run_report_job
+def generate_excel(job, layout, *resources, **settings):
+    from report_core import run_report_job
+    return run_report_job(job, layout, *resources, **settings)
+
+def generate_consolidated(job, layout, *resources, **settings):
+    from consolidation import run_consolidated_job
+    return run_consolidated_job(job, layout, *resources, **settings)
+
+# Прогресс задания перерисовывается раз в секунду, не перезапуская весь
+# скрипт. Когда задание завершено, страница перезапускается один раз,
+# и результат рисуется уже вне фрагмента — без ежесекундной переотправки файла
+@st.fragment(run_every=1)
+def show_job_progress(job_key):
+    job = get_jobs().get(job_key)
+    if job is None or job.done:
+        st.rerun()
+    st.progress(job.fraction(), text=job.describe())
+
+def show_report_job():
+    job_key = st.session_state.get("report_job")
+    job = get_jobs().get(job_key) if job_key else None
+    if job is None:
+        return
+    if not job.done:
+        show_job_progress(job_key)
+        return
+    if job.error is not None:
+        st.error(f"Не удалось сформировать отчёт: {job.error}")
+        return
+    st.success("Отчёт успешно сгенерирован!")
+    # Сводный отчёт ходит в API клиентами аккаунтов
+    stats = get_accounts().stats() if job_key[0] == "consolidated" else get_client().stats()
+    st.caption(f"Запросов к API: {stats['requests']}, повторов: {stats['retries']}, отказов по лимиту: {stats['throttled']}")
+    st.download_button(
+        label="Скачать Excel-файл",
+        data=job.result,
+        file_name="financial_report.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
+    # Модуль уже загружен заданием отчёта
+    from report_core import FORMATS
+    # Те же данные в CSV и Parquet: формируются при нажатии, без перезапуска страницы
+    for file_format, build in job.exports.items():
+        extension, mime = FORMATS[file_format]
+        st.download_button(
+            label=f"Скачать {file_format.upper()}",
+            data=build,
+            file_name=f"financial_report.{extension}",
+            mime=mime,
+            on_click="ignore"
+        )
+    # Время, строки, байты, запросы и, если включено, память по этапам запуска
+    if job.metrics is not None:
+        with st.expander("Диагностика"):
+            st.caption(f"Всего {job.metrics.total_seconds():.2f} с, кэш отчётов: {job.metrics.labels['cache']}")
+            receiver = get_receiver()
+            if receiver is not None:
+                hooks = receiver.stats()
+                st.caption(
+                    f"Веб-хуки: применено {hooks['applied']}, в очереди {hooks['queued']}, не применено {hooks['failed']}"
+                )
+            st.table([stage.as_dict() for stage in job.metrics.stages])
+
+
+# Страница отчёта вида layout (см. report_core.LAYOUTS): выбор периода,
+# кнопки отчёта и сводного отчёта, прогресс и скачивание. summary_label —
+# подпись флажка «только сводка». Общая для testy.py и app6.py
+def run(layout, summary_label):
+    st.markdown(DESCRIPTION)
+
+    # Метрики запусков идут строками JSON в лог report_metrics и, если задан
+    # metrics_path, дописываются в файл для наблюдения за временем отчётов.
+    # metrics_memory — добавлять к этапам RSS процесса
+    enable_logging()
+    settings = {"metrics_path": st.secrets.get("metrics_path"), "memory": st.secrets.get("metrics_memory", False)}
+
+    if st.secrets.get("webhook_port") is not None and not st.secrets.get("webhook_token"):
+        st.warning("Веб-хуки отключены: задан webhook_port, но не задан webhook_token")
+
+    # Сколько секунд после синхронизации данные считаются свежими. С веб-хуками
+    # синхронизация только страхует от пропущенных событий и нужна реже
+    if get_receiver() is None:
+        settings["sync_interval"] = st.secrets.get("sync_interval", 60)
+    else:
+        settings["sync_interval"] = st.secrets.get("webhook_sync_interval", 3600)
+
+    # Выбор периода отчёта
+    start_date_input = st.date_input("Дата начала", value=date(2022, 1, 1))
+    end_date_input = st.date_input("Дата окончания", value=date.today())
+
+    # Преобразование дат в формат datetime
+    start_date = datetime.combine(start_date_input, datetime.min.time())
+    end_date = datetime.combine(end_date_input, datetime.max.time())
+
+    # Сводка считается по итогам за дни, без обращения к отдельным ордерам
+    summary_only = st.checkbox(summary_label)
+
+    # Кнопка ставит задание в очередь; одинаковые запросы разных пользователей
+    # получают одно задание, а сессия помнит только его ключ
+    if st.button("Сгенерировать Отчёт"):
+        job_key = (layout, summary_only, start_date, end_date)
+        client, store, live_index = get_client(), get_store(), get_live_index()
+        report_cache, fragments = get_report_cache(), get_fragment_cache()
+        get_jobs().submit(
+            job_key,
+            lambda job: generate_excel(
+                job, layout, client, store, live_index, report_cache, fragments, start_date, end_date, summary_only,
+                **settings
+            )
+        )
+        st.session_state["report_job"] = job_key
+
+    if st.secrets.get("accounts") and st.button("Сводный отчёт по всем аккаунтам"):
+        job_key = ("consolidated", start_date, end_date)
+        accounts, report_cache = get_accounts(), get_report_cache()
+        get_jobs().submit(
+            job_key, lambda job: generate_consolidated(job, layout, accounts, report_cache, start_date, end_date, **settings)
+        )
+        st.session_state["report_job"] = job_key
+
+    show_report_job()
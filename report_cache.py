@@ -0,0 +1,66 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+# LRU-кэш готовых отчётов с временем жизни записи и ограничением
+# суммарного размера. Ключ должен включать версию данных, чтобы после
+# синхронизации устаревшие отчёты просто перестали запрашиваться
+class ReportCache:
+    def __init__(self, max_entries=32, max_bytes=256 * 2**20, ttl=600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # Значения не в байтах (куски отчёта, массивы numpy) сообщают размер через nbytes
+    @staticmethod
+    def _sizeof(value):
+        if isinstance(value, (bytes, bytearray)):
+            return len(value)
+        return getattr(value, "nbytes", None) or sys.getsizeof(value)
+
+    def _drop(self, key):
+        _, _, size = self._entries.pop(key)
+        self._size -= size
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        size = self._sizeof(value)
+        # Отчёт больше всего кэша не сохраняем, чтобы не вытеснять всё остальное
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value, size)
+            self._size += size
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def get_or_create(self, key, factory):
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            self.put(key, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._size, 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,147 @@
+from metrics import RunMetrics
+from report import build_balance_report, build_balance_summary, build_ledger_report, build_ledger_summary
+from report_fragments import render_month_report
+from report_jobs import STAGE_AGGREGATE, STAGE_RENDER, STAGE_SYNC
+
+# Вид отчёта -> (полный отчёт, только сводка). Балансовый отчёт (testy.py)
+# продолжает нарастающий итог PLN от остатка на начало периода, ledger (app6.py) — нет
+LAYOUTS = {
+    "balance": (build_balance_report, build_balance_summary),
+    "ledger": (build_ledger_report, build_ledger_summary)
+}
+
+# Формат файла -> (расширение, MIME). CSV и Parquet содержат те же строки,
+# что лист деталей XLSX (или сводку), с суммами в копейках
+FORMATS = {
+    "xlsx": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "csv": ("csv", "text/csv"),
+    "parquet": ("parquet", "application/vnd.apache.parquet")
+}
+
+
+# Готовый файл по ордерам периода. progress(обработано, всего).
+# export тянет pyarrow, поэтому загружается только для CSV и Parquet
+def render_orders(layout, orders, opening_pln_balance=0, progress=None, file_format="xlsx"):
+    build_report, _ = LAYOUTS[layout]
+    on_rows = None
+    if progress is not None:
+        total = len(orders)
+        on_rows = lambda done: progress(done, total)
+    if file_format == "csv":
+        from export import build_csv
+        return build_csv(layout, orders, opening_pln_balance, on_rows)
+    if file_format == "parquet":
+        from export import build_parquet
+        return build_parquet(layout, orders, opening_pln_balance, on_rows)
+    if layout == "balance":
+        return build_report(orders, opening_pln_balance, progress=on_rows).getvalue()
+    return build_report(orders, progress=on_rows).getvalue()
+
+
+# Только сводный лист по готовым итогам периода
+def render_summary(layout, totals, file_format="xlsx"):
+    if file_format == "csv":
+        from export import build_summary_csv
+        return build_summary_csv(layout, totals)
+    if file_format == "parquet":
+        from export import build_summary_parquet
+        return build_summary_parquet(layout, totals)
+    _, build_summary = LAYOUTS[layout]
+    return build_summary(totals).getvalue()
+
+
+# Синхронизация хранилища как этап запуска: сколько документов пришло,
+# сколько запросов ушло и сколько байт получено. Клиент общий для всех
+# запусков процесса, поэтому одновременные синхронизации попадут в оба замера
+def sync_store(store, client, metrics, **options):
+    before = client.stats()
+    with metrics.stage("sync") as stage:
+        stage.rows = store.sync(client, **options)
+    after = client.stats()
+    stage.requests = after["requests"] - before["requests"]
+    stage.bytes = after["wire_bytes"] - before["wire_bytes"]
+
+
+# Отчёт за период по индексу ордеров; не зависит от Streamlit,
+# поэтому одинаково работает в приложениях и в пакетной генерации.
+# Этапы выборки и формирования файла записываются в metrics. Если передан
+# fragments (ReportCache), XLSX собирается из готовых кусков по месяцам
+def render_report(index, layout, start_date, end_date, summary_only=False, progress=None, metrics=None,
+                  file_format="xlsx", fragments=None):
+    if metrics is None:
+        metrics = RunMetrics("report")
+    # Веб-хуки меняют индекс на месте; отчёт строится по неизменному состоянию
+    with index.lock:
+        if summary_only:
+            with metrics.stage("summary") as stage:
+                data = render_summary(layout, index.rollup.period_totals(start_date, end_date), file_format)
+                stage.bytes = len(data)
+            return data
+        if fragments is not None and file_format == "xlsx":
+            # rows — сколько ордеров отрендерено заново, а не взято из готовых месяцев
+            with metrics.stage("render") as stage:
+                data, stage.rows = render_month_report(index, layout, start_date, end_date, fragments, progress)
+                stage.bytes = len(data)
+            return data
+        with metrics.stage("select") as stage:
+            orders = index.select(start_date, end_date)
+            opening_pln_balance = index.rollup.opening_pln_balance(start_date)
+            stage.rows = len(orders)
+        # Итоги и строки листа считаются в одном потоковом проходе по пачкам,
+        # поэтому агрегация и запись XLSX — один этап
+        with metrics.stage("render") as stage:
+            data = render_orders(layout, orders, opening_pln_balance, progress, file_format)
+            stage.rows = len(orders)
+            stage.bytes = len(data)
+        return data
+
+
+# Задание отчёта для приложений (testy.py — balance, app6.py — ledger):
+# синхронизация, индекс, файл через кэш отчётов и метрики запуска.
+# Выполняется в фоновом потоке ReportJobs; все ресурсы передаются готовыми,
+# в job пишутся этап, прогресс по страницам и строкам и экспорт в CSV
+# и Parquet по требованию. sync_interval — сколько секунд после
+# синхронизации данные считаются свежими; metrics_path — файл метрик;
+# memory — записывать в метрики RSS после каждого этапа
+def run_report_job(job, layout, client, store, live_index, report_cache, fragments, start_date, end_date,
+                   summary_only=False, sync_interval=0, metrics_path=None, memory=False):
+    metrics = job.metrics = RunMetrics(
+        "report", memory=memory, layout=layout, start=start_date.date(), end=end_date.date(), summary_only=summary_only,
+        cache="hit"
+    )
+    job.stage = STAGE_SYNC
+    sync_store(store, client, metrics, max_age=sync_interval, progress=job.on_pages)
+    with metrics.stage("index") as stage:
+        index = live_index.current()
+        stage.rows = len(index)
+
+    # Ключ кэша — версия именно того индекса, по которому строится файл.
+    # Веб-хуки меняют индекс на месте под его lock, поэтому ключ берётся
+    # и файл строится под тем же lock
+    def cached(file_format, factory):
+        with index.lock:
+            key = (layout, file_format, summary_only, start_date, end_date, index.revision)
+            return report_cache.get_or_create(key, factory)
+
+    def render():
+        metrics.labels["cache"] = "miss"
+        job.stage = STAGE_AGGREGATE
+        with metrics.stage("rollup"):
+            # Итоги по дням строятся при первом обращении к индексу
+            index.rollup
+        job.stage = STAGE_RENDER
+        # В балансовом отчёте PLN total продолжается от остатка наличных на начало периода
+        return render_report(
+            index, layout, start_date, end_date, summary_only, progress=job.on_rows, metrics=metrics, fragments=fragments
+        )
+
+    # CSV и Parquet строятся только по нажатию их кнопок и тоже кэшируются
+    def export(file_format):
+        return lambda: cached(
+            file_format, lambda: render_report(index, layout, start_date, end_date, summary_only, file_format=file_format)
+        )
+
+    job.exports = {file_format: export(file_format) for file_format in ("csv", "parquet")}
+    data = cached("xlsx", render)
+    metrics.record(metrics_path)
+    return data
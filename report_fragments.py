@@ -0,0 +1,136 @@
+from io import BytesIO
+
+from aggregate import OrderColumns, Totals, as_money
+from report import (
+    LEDGER_PAYMENT_TYPES, append_balance_summary, append_ledger_summary, create_balance_sheets,
+    create_ledger_sheets, iter_chunks
+)
+from xlsx_render import PLN_TOTAL, PLN_TOTAL_NEGATIVE, XlsxRenderer
+from xlsx_stitch import EMPTY_CELL, PLACEHOLDER, deflate_part, number_cell, stitch_sheet, text_cell
+
+
+# Строки листа деталей «Остатки по валютам» — те же, что пишет write_balance_report.
+# styles — номера стилей PLN total (обычный, отрицательный) в книге
+def balance_rows(chunk, running, styles):
+    total_style, negative_style = styles
+    rows = []
+    for order, pln_total in zip(chunk, running):
+        currency = order.currency
+        if not currency:
+            continue
+        sum_value = as_money(order.amount)
+        payment_type = order.payment_type
+        is_cash = payment_type == "Cash-in-showroom"
+        cells = [
+            text_cell(order.moment.split(" ")[0]),
+            text_cell(order.name),
+            number_cell(sum_value if is_cash and currency == "PLN" else 0),
+            number_cell(as_money(pln_total), negative_style if pln_total < 0 else total_style)
+        ]
+        # Ячейки без r идут подряд, поэтому пропуск колонки — пустая ячейка <c/>
+        cells.append(number_cell(sum_value) if is_cash and currency == "USD" else EMPTY_CELL)
+        cells.append(number_cell(sum_value) if is_cash and currency == "EUR" else EMPTY_CELL)
+        cells.append(number_cell(sum_value) if payment_type == "Card-in-showroom" else EMPTY_CELL)
+        cells.append(text_cell(currency))
+        cells.append(text_cell(order.comment))
+        rows.append(f"<row>{''.join(cells)}</row>")
+    return rows
+
+
+# Строки листа деталей «Баланс по валютам» — те же, что пишет write_ledger_report
+def ledger_rows(chunk, running, styles):
+    rows = []
+    for order in chunk:
+        currency = order.currency
+        payment_type = LEDGER_PAYMENT_TYPES.get(order.payment_type)
+        if not payment_type or not currency:
+            continue
+        rows.append("<row>" + "".join([
+            text_cell(order.moment.split(" ")[0]), text_cell(order.name), number_cell(as_money(order.amount)),
+            text_cell(currency), text_cell(payment_type), text_cell(order.doc_type),
+            text_cell("yes" if order.test_order else "no"), text_cell(order.comment)
+        ]) + "</row>")
+    return rows
+
+
+# Вид отчёта -> (листы книги, строки деталей)
+FRAGMENT_LAYOUTS = {
+    "balance": (create_balance_sheets, balance_rows),
+    "ledger": (create_ledger_sheets, ledger_rows)
+}
+
+
+# Строки деталей одного месяца, уже сжатые куском deflate, и итоги месяца:
+# суммы и количества за месяц и остаток наличных PLN на его конец
+class MonthFragment:
+    __slots__ = ("part", "totals")
+
+    def __init__(self, part, totals):
+        self.part = part
+        self.totals = totals
+
+    @property
+    def nbytes(self):
+        return len(self.part.data) + self.totals.sums.nbytes + self.totals.counts.nbytes
+
+
+def render_fragment(layout, orders, opening_pln_balance, styles, progress=None):
+    _, write_rows = FRAGMENT_LAYOUTS[layout]
+    totals = Totals(opening_pln_balance)
+
+    def blocks():
+        for chunk in iter_chunks(orders, progress=progress):
+            running = totals.add(OrderColumns(chunk)).tolist()
+            yield "".join(write_rows(chunk, running, styles)).encode()
+
+    return MonthFragment(deflate_part(blocks()), totals)
+
+
+# XLSX за период, собранный из кусков по месяцам. Кусок ищется в fragments
+# (ReportCache) по хэшу ордеров месяца и остатку PLN на его начало, поэтому
+# заново строятся только месяцы, где что-то изменилось, — обычно текущий.
+# Исправление задним числом сдвигает остаток и перестраивает все месяцы после него.
+# Возвращает (файл, сколько ордеров пришлось отрендерить заново)
+def render_month_report(index, layout, start_date, end_date, fragments, progress=None):
+    create_sheets, _ = FRAGMENT_LAYOUTS[layout]
+    balance = layout == "balance"
+    renderer = XlsxRenderer()
+    summary_sheet, details_sheet = create_sheets(renderer)
+    # Номера стилей задаются порядком регистрации и одинаковы во всех книгах;
+    # они всё равно входят в ключ, чтобы кусок не попал в книгу с другой таблицей стилей
+    styles = ()
+    if balance:
+        styles = (
+            renderer.styled_cell(details_sheet, PLN_TOTAL).style_id,
+            renderer.styled_cell(details_sheet, PLN_TOTAL_NEGATIVE).style_id
+        )
+
+    first, last = index.bounds(start_date, end_date)
+    totals = Totals(index.rollup.opening_pln_balance(start_date) if balance else 0)
+    parts = []
+    rendered = 0
+    for _, lower, upper in index.month_bounds(first, last):
+        # Нарастающий итог PLN переходит из месяца в месяц; ledger его не выводит
+        opening = totals.pln_balance if balance else 0
+        key = (layout, index.digest(lower, upper), opening, styles)
+        fragment = fragments.get(key)
+        if fragment is None:
+            on_rows = None
+            if progress is not None:
+                on_rows = lambda done, offset=lower - first: progress(offset + done, last - first)
+            fragment = render_fragment(layout, index.orders[lower:upper], opening, styles, on_rows)
+            fragments.put(key, fragment)
+            rendered += upper - lower
+        totals.extend(fragment.totals)
+        parts.append(fragment.part)
+        if progress is not None:
+            progress(upper - first, last - first)
+
+    details_sheet.append([PLACEHOLDER])
+    if balance:
+        append_balance_summary(summary_sheet, totals)
+    else:
+        append_ledger_summary(renderer, summary_sheet, totals)
+    sheet_path = f"xl/worksheets/sheet{renderer.wb.worksheets.index(details_sheet) + 1}.xml"
+    output = stitch_sheet(renderer.save(BytesIO()), sheet_path, parts, BytesIO())
+    return output.getvalue(), rendered
@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+STAGE_QUEUED = "В очереди"
+STAGE_SYNC = "Загрузка из МоегоСклада"
+STAGE_AGGREGATE = "Подготовка данных"
+STAGE_RENDER = "Формирование файла"
+STAGE_DONE = "Готово"
+STAGE_FAILED = "Ошибка"
+
+
+# Фоновое формирование одного отчёта. Поля прогресса пишет рабочий поток,
+# а скрипт Streamlit только читает их при очередном перезапуске
+class ReportJob:
+    def __init__(self, key):
+        self.key = key
+        self.stage = STAGE_QUEUED
+        self.pages_done = 0
+        self.pages_total = 0
+        self.rows_done = 0
+        self.rows_total = 0
+        self.result = None
+        self.error = None
+        # RunMetrics запуска, если рабочая функция их ведёт
+        self.metrics = None
+        # Другие форматы того же отчёта: формат -> функция, строящая файл по требованию
+        self.exports = {}
+        self.started_at = time.time()
+        self.finished_at = None
+        self._finished = threading.Event()
+
+    @property
+    def done(self):
+        return self._finished.is_set()
+
+    def wait(self, timeout=None):
+        return self._finished.wait(timeout)
+
+    def on_pages(self, pages_done, pages_total):
+        self.pages_done, self.pages_total = pages_done, pages_total
+
+    def on_rows(self, rows_done, rows_total):
+        self.rows_done, self.rows_total = rows_done, rows_total
+
+    # Доля выполненной работы: загрузка страниц — первая половина, строки отчёта — вторая
+    def fraction(self):
+        if self.done:
+            return 1.0
+        fetched = self.pages_done / self.pages_total if self.pages_total else 0.0
+        if self.stage in (STAGE_QUEUED, STAGE_SYNC):
+            return 0.5 * fetched
+        rendered = self.rows_done / self.rows_total if self.rows_total else 0.0
+        return 0.5 + 0.5 * rendered
+
+    def describe(self):
+        parts = [self.stage]
+        if self.pages_total:
+            parts.append(f"страниц {self.pages_done} из {self.pages_total}")
+        if self.rows_total:
+            parts.append(f"строк {self.rows_done} из {self.rows_total}")
+        return ", ".join(parts)
+
+
+# Очередь фоновых отчётов, общая для всех сессий процесса. Задание живёт
+# независимо от перезапусков скрипта; одинаковые запросы, пока задание
+# выполняется, получают одно и то же задание
+class ReportJobs:
+    def __init__(self, max_workers=2, keep_finished=16):
+        self.keep_finished = keep_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="report-job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    # work(job) возвращает байты готового файла
+    def submit(self, key, work):
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and not job.done:
+                return job
+            job = ReportJob(key)
+            self._jobs.pop(key, None)
+            self._jobs[key] = job
+            self._trim()
+        self._executor.submit(self._run, job, work)
+        return job
+
+    def get(self, key):
+        with self._lock:
+            return self._jobs.get(key)
+
+    # Завершённые задания хранятся ограниченно, чтобы файл успели забрать
+    def _trim(self):
+        finished = [key for key, job in self._jobs.items() if job.done]
+        for key in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[key]
+
+    @staticmethod
+    def _run(job, work):
+        try:
+            job.result = work(job)
+            job.stage = STAGE_DONE
+        except Exception as exc:
+            job.error = exc
+            job.stage = STAGE_FAILED
+        finally:
+            job.finished_at = time.time()
+            job._finished.set()
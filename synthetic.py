@@ -0,0 +1,227 @@
+import random
+from array import array
+from datetime import datetime, timedelta
+from heapq import merge
+from operator import attrgetter
+
+from payload import slim_row
+from records import CURRENCIES, CURRENCY_BY_ID, DOC_TYPES, EXPENSE, INCOME, CashOrder
+
+API_URL = "https://api.moysklad.ru/api/remap/1.2"
+ACCOUNT_ID = "1f1a1c3e-0000-11ec-0a80-000000000000"
+
+PAYMENT_TYPES = ("Cash-in-showroom", "Card-in-showroom", "Bank-transfer")
+COMMENTS = ("Оплата в шоуруме", "Предоплата по заказу", "Возврат покупателю", "")
+
+# Доли приходов и расходов в общем числе документов
+ORDER_TYPE_SHARES = {"cashin": 0.6, "cashout": 0.4}
+
+# Синтетические данные охватывают три года, начиная с этой даты
+FIRST_MOMENT = datetime(2022, 1, 1)
+SPAN_SECONDS = 3 * 365 * 86400
+
+
+def meta(path, entity_type):
+    return {
+        "href": f"{API_URL}/{path}",
+        "metadataHref": f"{API_URL}/entity/{entity_type}/metadata",
+        "type": entity_type,
+        "mediaType": "application/json"
+    }
+
+
+# Документы одного типа в компактных колонках; полный документ в формате
+# API строится только по запросу, поэтому миллион строк занимает десятки
+# мегабайт, а не гигабайты. Строки отсортированы по moment
+class SyntheticOrders:
+    def __init__(self, count, order_type="cashin", seed=1):
+        self.order_type = order_type
+        self.type_code = list(DOC_TYPES).index(order_type) + 1
+        rnd = random.Random(f"{seed}:{order_type}")
+        currency_ids = list(CURRENCY_BY_ID)
+        step = max(2, 2 * SPAN_SECONDS // max(count, 1))
+
+        self.moments = []
+        self.sums = array("q")
+        self.currencies = array("b")
+        self.payment_types = array("b")
+        self.test_orders = array("b")
+        self.comments = array("b")
+        moment = FIRST_MOMENT
+        for number in range(count):
+            moment += timedelta(seconds=rnd.randint(1, step))
+            # МойСклад отдаёт moment то с миллисекундами, то без них
+            self.moments.append(f"{moment:%Y-%m-%d %H:%M:%S}" + (".000" if number % 3 else ""))
+            self.sums.append(rnd.randint(100, 500000))
+            self.currencies.append(rnd.randrange(len(currency_ids)))
+            roll = rnd.random()
+            self.payment_types.append(0 if roll < 0.45 else 1 if roll < 0.9 else 2 if roll < 0.95 else -1)
+            self.test_orders.append(rnd.random() < 0.05)
+            self.comments.append(rnd.randrange(len(COMMENTS)))
+        self.currency_ids = currency_ids
+
+    def __len__(self):
+        return len(self.moments)
+
+    def order_id(self, number):
+        return f"{number:08x}-{self.type_code:04x}-11ee-0a80-000000000000"
+
+    def updated(self, number):
+        moment = self.moments[number]
+        return moment if len(moment) > 19 else moment + ".000"
+
+    # Полный документ, как его возвращает /entity/cashin или /entity/cashout
+    def row(self, number):
+        order_type = self.order_type
+        order_id = self.order_id(number)
+        attributes = []
+        payment_type = self.payment_types[number]
+        if payment_type >= 0:
+            attributes.append({
+                "meta": meta(f"entity/{order_type}/metadata/attributes/1", "attributemetadata"),
+                "id": "1", "name": "PaymentType", "type": "customentity",
+                "value": {"meta": meta(f"entity/customentity/1/{payment_type}", "customentity"),
+                          "name": PAYMENT_TYPES[payment_type]}
+            })
+        if self.test_orders[number] or number % 2:
+            attributes.append({
+                "meta": meta(f"entity/{order_type}/metadata/attributes/2", "attributemetadata"),
+                "id": "2", "name": "test_order", "type": "boolean", "value": bool(self.test_orders[number])
+            })
+        return {
+            "meta": meta(f"entity/{order_type}/{order_id}", order_type),
+            "id": order_id,
+            "accountId": ACCOUNT_ID,
+            "owner": {"meta": meta("entity/employee/1", "employee")},
+            "shared": True,
+            "group": {"meta": meta("entity/group/1", "group")},
+            "updated": self.updated(number),
+            "name": f"{number:06d}",
+            "description": COMMENTS[self.comments[number]],
+            "externalCode": f"ext-{number}",
+            "moment": self.moments[number],
+            "applicable": True,
+            "rate": {"currency": {"meta": meta(f"entity/currency/{self.currency_ids[self.currencies[number]]}", "currency")}},
+            "sum": self.sums[number],
+            "organization": {"meta": meta("entity/organization/1", "organization")},
+            "agent": {"meta": meta("entity/counterparty/1", "counterparty")},
+            "created": self.updated(number),
+            "printed": False,
+            "published": False,
+            "files": {"meta": {**meta(f"entity/{order_type}/{order_id}/files", "files"), "size": 0, "limit": 1000, "offset": 0}},
+            "vatSum": 0.0,
+            "paymentPurpose": COMMENTS[self.comments[number]],
+            "attributes": attributes
+        }
+
+    def rows(self, start=0, stop=None):
+        for number in range(start, len(self) if stop is None else stop):
+            yield self.row(number)
+
+    # Те же документы сразу в виде CashOrder, без промежуточного JSON
+    def cash_orders(self):
+        doc_type = DOC_TYPES[self.order_type]
+        currencies = [CURRENCY_BY_ID[currency_id] for currency_id in self.currency_ids]
+        for number, moment in enumerate(self.moments):
+            payment_type = self.payment_types[number]
+            amount = self.sums[number]
+            yield CashOrder(
+                moment,
+                f"{number:06d}",
+                amount if doc_type == INCOME else -amount,
+                currencies[self.currencies[number]],
+                PAYMENT_TYPES[payment_type] if payment_type >= 0 else None,
+                bool(self.test_orders[number]),
+                doc_type,
+                COMMENTS[self.comments[number]]
+            )
+
+
+# Набор cashin/cashout общим объёмом count документов
+def synthetic_dataset(count, seed=1):
+    return {
+        order_type: SyntheticOrders(round(count * share), order_type, seed)
+        for order_type, share in ORDER_TYPE_SHARES.items()
+    }
+
+
+# Ордера обоих типов набора, слитые по moment
+def dataset_orders(dataset):
+    return merge(*(orders.cash_orders() for orders in dataset.values()), key=attrgetter("moment"))
+
+
+# Облегчённые ордера, отсортированные по moment
+def synthetic_orders(count, seed=1):
+    rnd = random.Random(seed)
+    moment = datetime(2022, 1, 1)
+    payment_types = ("Cash-in-showroom", "Card-in-showroom", None)
+    for number in range(count):
+        moment += timedelta(seconds=rnd.randint(1, 600))
+        income = rnd.random() < 0.6
+        amount = rnd.randint(100, 500000)
+        yield CashOrder(
+            f"{moment:%Y-%m-%d %H:%M:%S}.000",
+            f"{number:06d}",
+            amount if income else -amount,
+            rnd.choice(CURRENCIES),
+            rnd.choice(payment_types),
+            rnd.random() < 0.05,
+            INCOME if income else EXPENSE,
+            "Оплата в шоуруме"
+        )
+
+
+# Сырые документы в формате API МоегоСклада
+def synthetic_rows(count, order_type="cashin", seed=1):
+    return SyntheticOrders(count, order_type, seed).rows()
+
+
+# Тело веб-хука МоегоСклада с одним событием по документу
+def webhook_payload(order_type, order_id, action, moment):
+    return {
+        "auditContext": {"meta": meta(f"audit/{order_id}", "audit"), "uid": "admin@showroom", "moment": moment[:19]},
+        "events": [{"meta": meta(f"entity/{order_type}/{order_id}", order_type), "action": action, "accountId": ACCOUNT_ID}]
+    }
+
+
+# Запись веб-хуков поверх набора в формате WebhookReceiver(record_path=...):
+# count событий, каждое со своим состоянием документа после него. Новые
+# документы идут после последнего ордера набора, изменения меняют сумму
+# и иногда moment, удаляются существующие документы
+def synthetic_webhooks(dataset, count, seed=1):
+    rnd = random.Random(f"{seed}:webhooks")
+    order_types = list(dataset)
+    created = {order_type: len(orders) for order_type, orders in dataset.items()}
+    deleted = set()
+    last = max(datetime.fromisoformat(orders.moments[-1][:19]) for orders in dataset.values() if len(orders))
+    entries = []
+    for number in range(count):
+        order_type = rnd.choice(order_types)
+        orders = dataset[order_type]
+        at = f"{last + timedelta(seconds=number + 1):%Y-%m-%d %H:%M:%S}.000"
+        existing = rnd.randrange(len(orders))
+        roll = rnd.random()
+        if roll < 0.5 or (order_type, existing) in deleted:
+            action = "CREATE"
+            order_id = orders.order_id(created[order_type])
+            row = {**slim_row(orders.row(existing)), "id": order_id, "name": f"{created[order_type]:06d}", "moment": at}
+            created[order_type] += 1
+        elif roll < 0.85:
+            action = "UPDATE"
+            order_id = orders.order_id(existing)
+            row = {**slim_row(orders.row(existing)), "sum": rnd.randint(100, 500000)}
+            if rnd.random() < 0.2:
+                moved = datetime.fromisoformat(row["moment"][:19]) + timedelta(days=rnd.randint(-40, 40))
+                row["moment"] = f"{moved:%Y-%m-%d %H:%M:%S}"
+        else:
+            action = "DELETE"
+            order_id = orders.order_id(existing)
+            deleted.add((order_type, existing))
+            row = None
+        if row is not None:
+            row["updated"] = at
+        entries.append({
+            "payloads": [webhook_payload(order_type, order_id, action, at)],
+            "documents": {f"{order_type}/{order_id}": row}
+        })
+    return entries
@@ -0,0 +1,137 @@
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import requests
+
+from records import CURRENCY_BY_ID
+from synthetic import API_URL, synthetic_dataset, synthetic_webhooks
+
+# Код валюты -> UUID валюты для ссылки rate.currency
+CURRENCY_IDS = {currency: currency_id for currency_id, currency in CURRENCY_BY_ID.items()}
+UNKNOWN_CURRENCY_ID = "00000000-0000-0000-0000-000000000000"
+
+
+# Документ в формате API из облегчённой строки записи: ровно те поля,
+# которые читает payload.slim_row
+def api_document(row, order_type):
+    attributes = [{"name": "test_order", "type": "boolean", "value": row["test_order"]}]
+    if row["payment_type"]:
+        attributes.append({"name": "PaymentType", "type": "customentity", "value": {"name": row["payment_type"]}})
+    currency_id = CURRENCY_IDS.get(row["currency"], UNKNOWN_CURRENCY_ID)
+    return {
+        "meta": {"href": f"{API_URL}/entity/{order_type}/{row['id']}", "type": order_type},
+        "id": row["id"],
+        "name": row["name"],
+        "moment": row["moment"],
+        "updated": row["updated"],
+        "applicable": row["applicable"],
+        "sum": row["sum"],
+        "description": row["description"],
+        "rate": {"currency": {"meta": {"href": f"{API_URL}/entity/currency/{currency_id}"}}},
+        "attributes": attributes
+    }
+
+
+# Запись — строки JSON: {"payloads": [тела веб-хуков], "documents": {"тип/id": строка или null}}
+def read_recording(path):
+    with open(path, encoding="utf-8") as recording:
+        return [json.loads(line) for line in recording if line.strip()]
+
+
+def make_handler(documents):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            order_type, _, order_id = urlparse(self.path).path.rstrip("/").rpartition("/entity/")[2].partition("/")
+            row = documents.get(f"{order_type}/{order_id}")
+            body = json.dumps(api_document(row, order_type), ensure_ascii=False).encode() if row else b""
+            self.send_response(200 if row else 404)
+            self.send_header("Content-Type", "application/json;charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+# Локальная замена МоегоСклада для приёмника веб-хуков: отдаёт документы
+# из записи по /entity/<тип>/<id> и по очереди отправляет записанные тела
+# веб-хуков на адрес приёмника. Перед каждой пачкой документы переходят
+# в записанное для неё состояние, удалённые отвечают 404
+class WebhookReplay:
+    def __init__(self, entries, port=0):
+        self.entries = entries
+        self.port = port
+        self.documents = {}
+        self.server = None
+        self.base_url = None
+
+    def start(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", self.port), make_handler(self.documents))
+        threading.Thread(target=self.server.serve_forever, name="webhook-replay", daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/entity"
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    # wait() вызывается после каждой пачки — например, WebhookReceiver.wait_idle,
+    # чтобы приёмник успел запросить документы до следующего изменения.
+    # Возвращает число отправленных тел
+    def play(self, target_url, wait=None, interval=0.0):
+        sent = 0
+        with requests.Session() as session:
+            for entry in self.entries:
+                self.documents.update(entry["documents"])
+                for payload in entry["payloads"]:
+                    session.post(target_url, json=payload).raise_for_status()
+                    sent += 1
+                if wait is not None:
+                    wait()
+                if interval:
+                    time.sleep(interval)
+        return sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение записанных веб-хуков МоегоСклада")
+    parser.add_argument("target", help="адрес приёмника, например http://127.0.0.1:8502/?token=...")
+    parser.add_argument("--recording", help="файл записи WebhookReceiver; без него — синтетические события")
+    parser.add_argument("--rows", type=int, default=100_000, help="документов синтетического набора, как у moysklad_stub.py")
+    parser.add_argument("--events", type=int, default=100, help="синтетических событий")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8082, help="порт, с которого приёмник запрашивает документы")
+    parser.add_argument("--interval", type=float, default=0.0, help="пауза между пачками, секунды")
+    parser.add_argument("--linger", type=float, default=10.0, help="сколько секунд ещё отдавать документы после отправки")
+    args = parser.parse_args()
+
+    if args.recording:
+        entries = read_recording(args.recording)
+    else:
+        entries = synthetic_webhooks(synthetic_dataset(args.rows, args.seed), args.events, args.seed)
+    with WebhookReplay(entries, args.port) as replay:
+        print(f"документы: {replay.base_url}")
+        print(f"отправлено: {replay.play(args.target, interval=args.interval)}")
+        time.sleep(args.linger)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import argparse
+import hmac
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from moysklad import BASE_URL, CASH_ORDER_TYPES, DEFAULT_CONCURRENCY, MoySkladClient
+from order_store import OrderStore
+from payload import loads
+
+logger = logging.getLogger("webhooks")
+
+# Ссылка на документ в событии: тип сущности и id
+ENTITY_HREF = re.compile(r"/entity/(\w+)/([0-9a-f-]{36})")
+
+WEBHOOK_ACTIONS = ("CREATE", "UPDATE", "DELETE")
+
+
+# События веб-хука по кассовым ордерам: (тип документа, id, действие).
+# МойСклад присылает только ссылку на документ, сам документ запрашивается отдельно
+def parse_events(payload):
+    events = []
+    for event in payload.get("events", ()):
+        match = ENTITY_HREF.search(event.get("meta", {}).get("href", ""))
+        action = event.get("action")
+        if match and match.group(1) in CASH_ORDER_TYPES and action in WEBHOOK_ACTIONS:
+            events.append((match.group(1), match.group(2), action))
+    return events
+
+
+def make_handler(receiver):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def respond(self, status):
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        # МойСклад ждёт быстрого ответа и повторяет доставку при ошибке,
+        # поэтому события только ставятся в очередь
+        def do_POST(self):
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+            except ValueError:
+                length = -1
+            if length < 0:
+                # Тело не прочитать, поэтому соединение закрывается: иначе его
+                # остаток разбирался бы как следующий запрос
+                self.close_connection = True
+                self.respond(400)
+                return
+            body = self.rfile.read(length)
+            # compare_digest принимает строки только из ASCII, поэтому сравниваются байты
+            token = parse_qs(urlparse(self.path).query).get("token", [""])[0]
+            if not hmac.compare_digest(token.encode(), receiver.token.encode()):
+                self.respond(403)
+                return
+            try:
+                payload = loads(body)
+            except ValueError:
+                self.respond(400)
+                return
+            receiver.submit(payload)
+            self.respond(200)
+
+    return Handler
+
+
+# Приёмник веб-хуков МоегоСклада для cashin/cashout. Тела запросов копятся
+# в очереди; фоновый поток забирает их пачкой, запрашивает последние версии
+# изменённых документов и применяет их к хранилищу и, если передан
+# live_index, к индексу в памяти на месте. record_path — дописывать каждую
+# пачку (тела и полученные документы) строкой JSON для webhook_replay.py.
+# Без token приёмник не создаётся: иначе любой, кто достучался до порта,
+# мог бы менять хранилище
+class WebhookReceiver:
+    def __init__(self, store, client, live_index=None, token=None, record_path=None):
+        if not token:
+            raise ValueError("для приёмника веб-хуков нужен token")
+        self.store = store
+        self.client = client
+        self.live_index = live_index
+        self.token = token
+        self.record_path = record_path
+        self.server = None
+        self.last_event_at = None
+        self._payloads = queue.Queue()
+        self._lock = threading.Lock()
+        self._counters = {"payloads": 0, "events": 0, "fetched": 0, "applied": 0, "failed": 0}
+        threading.Thread(target=self._run, name="webhooks", daemon=True).start()
+
+    def submit(self, payload):
+        with self._lock:
+            self._counters["payloads"] += 1
+            self.last_event_at = time.time()
+        self._payloads.put(payload)
+
+    # Ждать, пока очередь не опустеет (для воспроизведения и замеров)
+    def wait_idle(self):
+        self._payloads.join()
+
+    def _run(self):
+        while True:
+            batch = [self._payloads.get()]
+            while True:
+                try:
+                    batch.append(self._payloads.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._apply(batch)
+            except Exception:
+                # Пачка не применена: следующий отчёт синхронизирует хранилище
+                # с сервером, не дожидаясь интервала, и подберёт пропущенное
+                logger.exception("не удалось применить %d событий веб-хуков", len(batch))
+                self.store.invalidate()
+                with self._lock:
+                    self._counters["failed"] += len(batch)
+            finally:
+                for _ in batch:
+                    self._payloads.task_done()
+
+    def _apply(self, batch):
+        # По каждому документу важно только последнее действие в пачке
+        latest = {}
+        for payload in batch:
+            for order_type, order_id, action in parse_events(payload):
+                latest[(order_type, order_id)] = action
+        fetch = [key for key, action in latest.items() if action != "DELETE"]
+        with ThreadPoolExecutor(max_workers=self.client.concurrency) as executor:
+            documents = dict(zip(fetch, executor.map(lambda key: self.client.get_document(*key), fetch)))
+        documents.update((key, None) for key, action in latest.items() if action == "DELETE")
+
+        applied = 0
+        for order_type in CASH_ORDER_TYPES:
+            # Документ, которого уже нет на сервере, удаляется и после CREATE/UPDATE
+            rows = [row for (entity, _), row in documents.items() if entity == order_type and row is not None]
+            deleted = [order_id for (entity, order_id), row in documents.items() if entity == order_type and row is None]
+            if not rows and not deleted:
+                continue
+            removed, added, before, after = self.store.apply_changes(order_type, rows, deleted)
+            if self.live_index is not None:
+                self.live_index.apply(removed, added, before, after)
+            applied += len(rows) + len(deleted)
+
+        with self._lock:
+            self._counters["events"] += len(latest)
+            self._counters["fetched"] += len(fetch)
+            self._counters["applied"] += applied
+        if self.record_path:
+            entry = {"payloads": batch, "documents": {f"{entity}/{order_id}": row for (entity, order_id), row in documents.items()}}
+            with open(self.record_path, "a", encoding="utf-8") as output:
+                output.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def stats(self):
+        with self._lock:
+            return {**self._counters, "queued": self._payloads.qsize(), "last_event_at": self.last_event_at}
+
+    # HTTP-сервер в фоновом потоке; адрес веб-хука — http://host:port/?token=...
+    # По умолчанию слушает только локальный адрес (за обратным прокси)
+    def serve(self, host="127.0.0.1", port=0):
+        self.server = ThreadingHTTPServer((host, port), make_handler(self))
+        threading.Thread(target=self.server.serve_forever, name="webhook-server", daemon=True).start()
+        return self
+
+    @property
+    def port(self):
+        return self.server.server_port
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Приёмник веб-хуков МоегоСклада для локального хранилища ордеров")
+    parser.add_argument("--store", default="orders.sqlite3")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--token", default=os.environ.get("MOYSKLAD_WEBHOOK_TOKEN"), help="секрет в параметре token адреса")
+    parser.add_argument("--record", help="дописывать полученные события и документы в этот файл")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--base-url", default=BASE_URL)
+    args = parser.parse_args()
+    if not args.token:
+        parser.error("нужен --token или переменная MOYSKLAD_WEBHOOK_TOKEN")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+
+    client = MoySkladClient(os.environ["MOYSKLAD_USERNAME"], os.environ["MOYSKLAD_PASSWORD"],
+                            base_url=args.base_url, concurrency=args.concurrency)
+    receiver = WebhookReceiver(OrderStore(args.store), client, token=args.token, record_path=args.record)
+    receiver.serve(args.host, args.port)
+    print(f"http://{args.host}:{receiver.port}/")
+    try:
+        while True:
+            time.sleep(60)
+            logger.info(json.dumps(receiver.stats()))
+    except KeyboardInterrupt:
+        receiver.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, NamedStyle, PatternFill
+
+PLN_TOTAL = "pln_total"
+PLN_TOTAL_NEGATIVE = "pln_total_negative"
+NEGATIVE_BALANCE = "negative_balance"
+
+
+# Стили отчёта. Экземпляры NamedStyle привязываются к книге,
+# поэтому для каждой книги создаются свои
+def report_styles():
+    return [
+        NamedStyle(name=PLN_TOTAL, font=Font(color="000000")),
+        NamedStyle(name=PLN_TOTAL_NEGATIVE, font=Font(color="FF0000")),
+        NamedStyle(name=NEGATIVE_BALANCE, fill=PatternFill(start_color="FFCCCC", end_color="FFCCCC", fill_type="solid")),
+    ]
+
+
+# Книга в write-only режиме: строки сериализуются сразу при append,
+# стили регистрируются один раз и не создаются заново на каждую ячейку
+class XlsxRenderer:
+    def __init__(self):
+        self.wb = Workbook(write_only=True)
+        for style in report_styles():
+            self.wb.add_named_style(style)
+
+    def create_sheet(self, title, header, widths=None):
+        sheet = self.wb.create_sheet(title)
+        for column, width in (widths or {}).items():
+            sheet.column_dimensions[column].width = width
+        sheet.append(header)
+        return sheet
+
+    # Ячейка-шаблон со стилем. Строка записывается в файл в момент append,
+    # поэтому одну и ту же ячейку можно переиспользовать, меняя только value
+    def styled_cell(self, sheet, style, value=None):
+        cell = WriteOnlyCell(sheet, value=value)
+        cell.style = style
+        return cell
+
+    def save(self, output):
+        self.wb.save(output)
+        return output
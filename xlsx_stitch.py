@@ -0,0 +1,146 @@
+import struct
+import zlib
+from zipfile import ZipFile
+
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+# Уровень сжатия кусков листа: куски сжимаются один раз и потом только копируются
+PART_COMPRESSION = 6
+
+# Текст строки-заглушки, на место которой в лист вставляются готовые куски
+PLACEHOLDER = "__stitched_rows__"
+
+CRC32_POLY = 0xEDB88320
+
+LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+CENTRAL_HEADER = struct.Struct("<4s6H3L5H2L")
+END_OF_DIRECTORY = struct.Struct("<4s4H2LH")
+
+
+# Ячейки строк без атрибутов r: Excel и openpyxl нумеруют такие строки и
+# ячейки подряд, поэтому кусок не зависит от того, с какой строки листа он
+# начнётся, а пропущенная колонка записывается пустой ячейкой.
+# Строки — inline, как их пишет openpyxl в write-only режиме
+EMPTY_CELL = "<c/>"
+
+
+def text_cell(value):
+    if not value:
+        return '<c t="inlineStr"/>'
+    value = ILLEGAL_CHARACTERS_RE.sub("", value).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    space = ' xml:space="preserve"' if value != value.strip() else ""
+    return f'<c t="inlineStr"><is><t{space}>{value}</t></is></c>'
+
+
+# Число в том же виде, что safe_string openpyxl; style — номер стиля ячейки
+def number_cell(value, style=None):
+    if style is None:
+        return f'<c t="n"><v>{value:.16g}</v></c>'
+    return f'<c s="{style}" t="n"><v>{value:.16g}</v></c>'
+
+
+# x * y по модулю многочлена CRC-32 (порт multmodp из zlib)
+def multmodp(x, y):
+    mask = 1 << 31
+    product = 0
+    while True:
+        if x & mask:
+            product ^= y
+            if not x & (mask - 1):
+                return product
+        mask >>= 1
+        y = (y >> 1) ^ CRC32_POLY if y & 1 else y >> 1
+
+
+# X2N[k] = x^(2^k) по модулю многочлена
+X2N = [1 << 30]
+for _ in range(31):
+    X2N.append(multmodp(X2N[-1], X2N[-1]))
+
+
+# CRC-32 склейки A + B по CRC обеих частей и длине B (crc32_combine из zlib)
+def crc32_combine(crc1, crc2, length2):
+    power = 1 << 31
+    k = 3
+    while length2:
+        if length2 & 1:
+            power = multmodp(X2N[k & 31], power)
+        length2 >>= 1
+        k += 1
+    return multmodp(power, crc1) ^ crc2
+
+
+# Кусок потока deflate вместе с CRC и длиной исходных байт. Промежуточные
+# куски закрываются Z_SYNC_FLUSH: они кончаются на границе байта без
+# признака последнего блока, поэтому их можно склеивать друг с другом
+# и с кусками, сжатыми позже и другим компрессором
+class DeflatedPart:
+    __slots__ = ("data", "crc", "size")
+
+    def __init__(self, data, crc, size):
+        self.data = data
+        self.crc = crc
+        self.size = size
+
+
+def deflate_part(chunks, final=False):
+    compressor = zlib.compressobj(PART_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+    parts = []
+    crc = size = 0
+    for chunk in chunks:
+        parts.append(compressor.compress(chunk))
+        crc = zlib.crc32(chunk, crc)
+        size += len(chunk)
+    parts.append(compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH))
+    return DeflatedPart(b"".join(parts), crc, size)
+
+
+def dos_date_time(date_time):
+    year, month, day, hour, minute, second = date_time
+    return hour << 11 | minute << 5 | second // 2, (year - 1980) << 9 | month << 5 | day
+
+
+# Zip из уже сжатых записей: (имя, дата, куски deflate). CRC и длины
+# склеиваются арифметически, сжатые байты только копируются
+def write_zip(output, entries):
+    directory = []
+    offset = 0
+    for name, date_time, parts in entries:
+        name = name.encode()
+        crc = size = compressed = 0
+        for part in parts:
+            crc = crc32_combine(crc, part.crc, part.size)
+            size += part.size
+            compressed += len(part.data)
+        mtime, mdate = dos_date_time(date_time)
+        output.write(LOCAL_HEADER.pack(b"PK\x03\x04", 20, 0, zlib.DEFLATED, mtime, mdate, crc, compressed, size, len(name), 0))
+        output.write(name)
+        for part in parts:
+            output.write(part.data)
+        directory.append(CENTRAL_HEADER.pack(
+            b"PK\x01\x02", 20, 20, 0, zlib.DEFLATED, mtime, mdate, crc, compressed, size, len(name), 0, 0, 0, 0, 0, offset
+        ) + name)
+        offset += LOCAL_HEADER.size + len(name) + compressed
+    for record in directory:
+        output.write(record)
+    output.write(END_OF_DIRECTORY.pack(
+        b"PK\x05\x06", 0, 0, len(directory), len(directory), sum(map(len, directory)), offset, 0
+    ))
+    return output
+
+
+# Книга, в которой на месте строки-заглушки листа sheet_path стоят готовые
+# куски parts. Остальные записи книги маленькие и пересжимаются целиком
+def stitch_sheet(workbook, sheet_path, parts, output):
+    entries = []
+    with ZipFile(workbook) as source:
+        for info in source.infolist():
+            data = source.read(info.filename)
+            if info.filename != sheet_path:
+                entries.append((info.filename, info.date_time, [deflate_part([data], final=True)]))
+                continue
+            marker = data.index(f"<t>{PLACEHOLDER}</t>".encode())
+            head = data[:data.rindex(b"<row", 0, marker)]
+            tail = data[data.index(b"</row>", marker) + len(b"</row>"):]
+            entries.append((info.filename, info.date_time, [deflate_part([head]), *parts, deflate_part([tail], final=True)]))
+    return write_zip(output, entries)